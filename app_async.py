@@ -0,0 +1,122 @@
+import asyncio
+import os
+import sys
+import zmq.asyncio
+from llm import BatchingParser, get_llm_client, BATCH_SYSTEM_PROMPT, LLM_BATCH_SIZE, LLM_PRELOAD, SYSTEM_PROMPT
+from methods import build_todoist_request, build_google_sheet_request, route_request
+from mq_client import AsyncLazyPirateClient
+
+# With GATEWAY_ENDPOINT set every request goes to the gateway, which routes it by method
+GATEWAY_ENDPOINT = os.getenv("GATEWAY_ENDPOINT")
+TODOIST_ENDPOINT = GATEWAY_ENDPOINT or "tcp://localhost:6001"
+GOOGLE_SHEET_ENDPOINT = GATEWAY_ENDPOINT or "tcp://localhost:6002"
+
+class AsyncClient:
+    """
+    asyncio version of the app.py client. The LLM call and the backend calls of many
+    queries overlap, and status is sent to both backends at the same time.
+    """
+    def __init__(self, max_in_flight=8, model="llama3.2",
+                 todoist_endpoint=TODOIST_ENDPOINT, google_sheet_endpoint=GOOGLE_SHEET_ENDPOINT,
+                 llm_batch_size=LLM_BATCH_SIZE):
+        self.max_in_flight = max_in_flight
+        self.model = model
+        # Queries in flight at the same time share Ollama calls when llm_batch_size > 1
+        self.parser = BatchingParser(model, llm_batch_size)
+        self.context = zmq.asyncio.Context()
+        self.pools = {
+            "todoist": AsyncLazyPirateClient(self.context, todoist_endpoint, "Todoist", max_in_flight),
+            "google_sheet": AsyncLazyPirateClient(self.context, google_sheet_endpoint, "Google Sheet", max_in_flight)
+        }
+
+    async def send_todoist(self, request):
+        new_request = build_todoist_request(request)
+        return await self.pools["todoist"].request(new_request)
+
+    async def send_google_sheet(self, request):
+        new_request = build_google_sheet_request(request)
+        return await self.pools["google_sheet"].request(new_request)
+
+    async def send_request_to_server(self, request):
+        services = route_request(request)
+
+        if len(services) > 1:
+            # Fan out to both servers, the latency is the slower call instead of the sum
+            todoist_response, google_sheet_response = await asyncio.gather(
+                self.send_todoist(request),
+                self.send_google_sheet(request)
+            )
+            return {
+                "todoist": todoist_response,
+                "google_sheet": google_sheet_response
+            }
+        if services[0] == "todoist":
+            return await self.send_todoist(request)
+        else:
+            return await self.send_google_sheet(request)
+
+    async def preload(self):
+        """Load the model before the first query needs it, unless LLM_PRELOAD is 0"""
+        if LLM_PRELOAD:
+            system = BATCH_SYSTEM_PROMPT if self.parser.max_batch > 1 else SYSTEM_PROMPT
+            return await get_llm_client(self.model).preload_async(system)
+        return False
+
+    async def handle_query(self, query):
+        """Parse one natural language query and send it to its server"""
+        request = await self.parser.parse(query)
+        return await self.send_request_to_server(request)
+
+    async def process_queries(self, queries, handler=None):
+        """
+        Run handler (handle_query by default) over an iterable of queries with at most
+        max_in_flight of them in progress, and yield (index, query, result, error) as each
+        one finishes. Queries are pulled from the iterable only when there is room, so
+        a long stream is never loaded at once.
+        """
+        handler = handler or self.handle_query
+        pending = {}
+        queries = iter(queries)
+        index = 0
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < self.max_in_flight:
+                try:
+                    query = next(queries)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[asyncio.ensure_future(handler(query))] = (index, query)
+                index += 1
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task_index, query = pending.pop(task)
+                error = task.exception()
+                yield task_index, query, None if error else task.result(), error
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+        self.context.term()
+
+async def main(queries):
+    client = AsyncClient()
+    try:
+        await client.preload()
+        async for index, query, result, error in client.process_queries(queries):
+            if error:
+                print(f"[{index}] {query!r} failed: {error}")
+            else:
+                print(f"[{index}] {query!r}: {result}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:] or [
+        "What is status of my Todoist and Google Sheet servers?",
+        "Check my tasks in Todoist",
+        "Who is Alice Smith?"
+    ]))
@@ -0,0 +1,89 @@
+'''
+Batch mode: stream a JSONL file of queries through parsing and dispatch.
+
+Every input line is one of:
+- a natural language query, either as plain text, a JSON string or {"query": "..."}
+- a pre-parsed request {"method": "...", "params": {...}}, sent without the LLM
+
+One result line per input is written as soon as it finishes, so the output order follows
+completion, not input; the "line" field points back to the input line.
+
+Usage:
+    python batch.py queries.jsonl -o results.jsonl --concurrency 16
+'''
+
+import argparse
+import asyncio
+import json
+import sys
+from app_async import AsyncClient
+from llm import llm_stats, LLM_BATCH_SIZE
+
+def read_inputs(path, query_field="query"):
+    """Yield (line_number, item) for every non empty line, one line at a time"""
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line
+            if isinstance(item, dict) and "method" not in item:
+                item = item.get(query_field, "")
+            yield line_number, item
+
+async def run_batch(inputs, output, client):
+    """Dispatch every input through client with bounded concurrency and write results as they finish"""
+    async def handle(entry):
+        _, item = entry
+        if isinstance(item, dict):
+            # Pre-parsed request, skip the LLM
+            response = await client.send_request_to_server(json.dumps(item))
+        else:
+            response = await client.handle_query(str(item))
+        return response
+
+    # Load the model while nothing waits for it yet
+    await client.preload()
+    total = failed = 0
+    async for _, (line_number, item), result, error in client.process_queries(inputs, handle):
+        total += 1
+        record = {"line": line_number, "input": item}
+        if error:
+            failed += 1
+            record.update({"success": False, "error": str(error)})
+        else:
+            record.update({"success": True, "response": result})
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+    return total, failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through the LLM agent pipeline.")
+    parser.add_argument("input", help="JSONL file of queries or pre-parsed requests, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="file for the JSONL results, - for stdout")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="queries in flight at the same time")
+    parser.add_argument("--model", default="llama3.2", help="Ollama model used for natural language queries")
+    parser.add_argument("--llm-batch", type=int, default=LLM_BATCH_SIZE,
+                        help="natural language queries parsed by one Ollama call, 1 disables batching")
+    parser.add_argument("--query-field", default="query", help="field holding the query in JSON object lines")
+    args = parser.parse_args()
+
+    client = AsyncClient(max_in_flight=args.concurrency, model=args.model, llm_batch_size=args.llm_batch)
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        inputs = read_inputs(args.input, args.query_field)
+        total, failed = asyncio.run(run_batch(inputs, output, client))
+        print(f"Processed {total} requests, {failed} failed.", file=sys.stderr)
+        print(f"LLM timings: {llm_stats(args.model)}", file=sys.stderr)
+        if args.llm_batch > 1:
+            print(f"LLM batching: {client.parser.stats()}", file=sys.stderr)
+    finally:
+        client.close()
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    main()
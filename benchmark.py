@@ -0,0 +1,314 @@
+'''
+Load generation benchmark for the ZeroMQ servers.
+
+todoist_mq and google_sheet_mq run in this process against fake Todoist and Google Sheets
+backends that sleep for a configurable latency instead of calling the real APIs, so no
+accounts are needed. Requests are sent at a fixed rate (open loop: latency is measured
+from the moment a request was due, so a slow server cannot hide its queueing delay) and
+throughput, p50/p95/p99 latency and errors are reported per method.
+
+Results go to benchmark_results.json, which index.html charts next to test_results.json.
+
+Usage:
+    python benchmark.py --rate 200 --duration 10 --sheet-latency 80 --todoist-latency 50
+'''
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import zmq
+
+import google_sheet_mq
+import wire
+import todoist_api as todoist
+import todoist_mq
+from google_sheet_api import GoogleSheetsAPI
+from todoist_cache import TaskCache
+
+DEFAULT_MIX = "find_person=4,insert_person=1,check_tasks=3,add_task=1,status=1"
+
+class FakeTodoistAPI:
+    """Stands in for todoist_api_python.TodoistAPI and the Sync API, every call sleeps for latency"""
+    def __init__(self, latency, project_id=None, tasks=100):
+        self.latency = latency
+        self.project_id = project_id
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._changes = []
+        for i in range(tasks):
+            self._record(f"Task {i}", "Seeded by the benchmark")
+
+    def _record(self, content, description):
+        with self._lock:
+            task = SimpleNamespace(id=str(next(self._ids)), content=content, description=description,
+                                   project_id=self.project_id)
+            self._changes.append(task)
+            return task
+
+    def add_task(self, content, description=None, project_id=None, due_string=None):
+        time.sleep(self.latency)
+        return self._record(content, description)
+
+    def get_tasks(self, project_id=None, limit=200):
+        with self._lock:
+            tasks = list(self._changes)
+        for start in range(0, len(tasks), limit):
+            # One request per page, like the real paginator
+            time.sleep(self.latency)
+            yield tasks[start:start + limit]
+
+    def sync_items(self, sync_token="*"):
+        time.sleep(self.latency)
+        with self._lock:
+            start = 0 if sync_token == "*" else int(sync_token)
+            changes = self._changes[start:]
+            new_token = str(len(self._changes))
+        items = [{"id": t.id, "project_id": t.project_id, "content": t.content, "description": t.description}
+                 for t in changes]
+        return items, new_token, sync_token == "*"
+
+class FakeSheetsService:
+    """Minimal spreadsheets().values() service whose get and append calls sleep for latency"""
+    def __init__(self, latency, rows=1000):
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.rows = [["name", "age", "occupation"]] + [[f"Person {i}", str(20 + i % 50), "Tester"] for i in range(rows)]
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, **kwargs):
+        return SimpleNamespace(execute=lambda http=None: self._get())
+
+    def append(self, body, **kwargs):
+        return SimpleNamespace(execute=lambda http=None: self._append(body["values"]))
+
+    def _get(self):
+        time.sleep(self.latency)
+        with self._lock:
+            return {"values": [list(row) for row in self.rows]}
+
+    def _append(self, values):
+        time.sleep(self.latency)
+        with self._lock:
+            self.rows.extend([[str(v) for v in row] for row in values])
+        return {"updates": {"updatedRows": len(values)}}
+
+class FakeGoogleSheetsAPI(GoogleSheetsAPI):
+    """The real GoogleSheetsAPI (replica, batching, locking) on top of FakeSheetsService"""
+    def __init__(self, latency, rows=1000):
+        self._fake_service = FakeSheetsService(latency, rows)
+        super().__init__()
+
+    def get_credentials(self):
+        return None
+
+    def get_google_sheets_service(self):
+        return self._fake_service
+
+    def new_http(self):
+        return None
+
+def start_servers(args):
+    """Run both servers in daemon threads against the fake backends"""
+    os.environ["TODOIST_MQ_WORKERS"] = str(args.server_workers)
+    os.environ["GOOGLE_SHEET_MQ_WORKERS"] = str(args.server_workers)
+    # Leave the metrics ports to servers that may be running next to the benchmark
+    os.environ["TODOIST_METRICS_PORT"] = "0"
+    os.environ["GOOGLE_SHEET_METRICS_PORT"] = "0"
+    # The fakes have no quota, the rate limiters only run when asked to
+    os.environ["SHEETS_RATE_PER_MINUTE"] = str(args.sheet_quota)
+    os.environ["TODOIST_RATE_PER_MINUTE"] = str(args.todoist_quota)
+
+    fake_todoist = FakeTodoistAPI(args.todoist_latency / 1000, todoist_mq.PROJECT_ID)
+    todoist.api = fake_todoist
+    todoist_mq.task_queue = None
+    todoist_mq.task_cache = TaskCache(fake_todoist.sync_items, todoist_mq.PROJECT_ID) if args.task_cache else None
+    google_sheet_mq.sheet_api = FakeGoogleSheetsAPI(args.sheet_latency / 1000, args.sheet_rows)
+
+    for target, port in ((todoist_mq.main, args.todoist_port), (google_sheet_mq.main, args.google_sheet_port)):
+        threading.Thread(target=target, args=(port,), daemon=True).start()
+
+def build_requests(args):
+    """Request factory and port of every benchmarked method"""
+    counter = itertools.count()
+    def person_name():
+        return f"Person {random.randrange(args.sheet_rows)}"
+    def new_person():
+        return {"name": f"Benchmark {os.getpid()} {next(counter)}", "age": 30, "occupation": "Benchmark"}
+    return {
+        "find_person": (args.google_sheet_port, lambda: {"method": "find_person", "params": {"name": person_name()}}),
+        "insert_person": (args.google_sheet_port, lambda: {"method": "insert_person", "params": new_person()}),
+        "check_tasks": (args.todoist_port, lambda: {"method": "check_tasks", "params": {}}),
+        "add_task": (args.todoist_port, lambda: {"method": "add_task", "params": {
+            "content": f"Benchmark task {next(counter)}", "description": "", "due_string": "tomorrow"}}),
+        "status": (args.google_sheet_port, lambda: {"method": "status", "params": {}})
+    }
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        method, _, weight = part.partition("=")
+        weights[method.strip()] = float(weight or 1)
+    return weights
+
+class LoadGenerator:
+    """Sends requests at a fixed rate from a pool of threads, each with its own REQ sockets"""
+    def __init__(self, context, requests, timeout, codec=None):
+        self.context = context
+        self.requests = requests
+        self.timeout = timeout
+        # None sends legacy single frame JSON
+        self.codec = codec
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.samples = {method: [] for method in requests}
+        self.errors = {method: 0 for method in requests}
+        self._sockets = []
+
+    def _socket(self, port):
+        if not hasattr(self._local, "sockets"):
+            self._local.sockets = {}
+        sockets = self._local.sockets
+        if port not in sockets:
+            socket = self.context.socket(zmq.REQ)
+            socket.connect(f"tcp://localhost:{port}")
+            sockets[port] = socket
+            with self._lock:
+                self._sockets.append(socket)
+        return sockets[port]
+
+    def close(self):
+        for socket in self._sockets:
+            socket.close(linger=0)
+
+    def send(self, method, due):
+        port, build = self.requests[method]
+        socket = self._socket(port)
+        ok = False
+        try:
+            if self.codec:
+                socket.send_multipart(wire.encode_request(build(), self.codec))
+            else:
+                socket.send_string(json.dumps(build()))
+            if socket.poll(self.timeout * 1000):
+                ok = wire.decode_reply(socket.recv_multipart()).get("success", False)
+            else:
+                # No reply in time: the REQ socket is stuck, replace it
+                socket.close(linger=0)
+                del self._local.sockets[port]
+        except zmq.ZMQError:
+            socket.close(linger=0)
+            self._local.sockets.pop(port, None)
+        latency = time.perf_counter() - due
+        with self._lock:
+            self.samples[method].append(latency)
+            if not ok:
+                self.errors[method] += 1
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[index]
+
+def summarize(samples, errors, duration):
+    summary = {}
+    for method, latencies in samples.items():
+        latencies = sorted(latencies)
+        summary[method] = {
+            "count": len(latencies),
+            "errors": errors[method],
+            "throughput": len(latencies) / duration if duration else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else None
+        }
+    return summary
+
+def run(args):
+    start_servers(args)
+    context = zmq.Context()
+    codec = None if args.codec == "legacy" else args.codec.encode()
+    generator = LoadGenerator(context, build_requests(args), args.timeout, codec)
+
+    weights = parse_mix(args.mix)
+    methods = list(weights)
+    total = int(args.rate * args.duration)
+    interval = 1 / args.rate
+
+    # Wait until both servers answer before the clock starts
+    for port, _ in (generator.requests["check_tasks"], generator.requests["find_person"]):
+        socket = context.socket(zmq.REQ)
+        socket.connect(f"tcp://localhost:{port}")
+        socket.send_string(json.dumps({"method": "status", "params": {}}))
+        socket.recv_string()
+        socket.close()
+
+    print(f"Sending {total} requests at {args.rate}/s for {args.duration}s...")
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        start = time.perf_counter()
+        for i in range(total):
+            due = start + i * interval
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            method = random.choices(methods, weights=[weights[m] for m in methods])[0]
+            pool.submit(generator.send, method, due)
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "duration": elapsed,
+        "methods": summarize(generator.samples, generator.errors, elapsed)
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    generator.close()
+    context.term()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark todoist_mq and google_sheet_mq against fake backends.")
+    parser.add_argument("--rate", type=float, default=200, help="requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="method=weight list")
+    parser.add_argument("--clients", type=int, default=64, help="client threads, bounds requests in flight")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds before a request counts as an error")
+    parser.add_argument("--server-workers", type=int, default=4, help="worker threads per server")
+    parser.add_argument("--sheet-latency", type=float, default=80, help="artificial Google Sheets latency in ms")
+    parser.add_argument("--sheet-rows", type=int, default=1000, help="rows in the fake sheet")
+    parser.add_argument("--sheet-quota", type=float, default=0, help="Sheets rate limit in requests per minute, 0 disables it")
+    parser.add_argument("--todoist-quota", type=float, default=0, help="Todoist rate limit in requests per minute, 0 disables it")
+    parser.add_argument("--todoist-latency", type=float, default=50, help="artificial Todoist latency in ms")
+    parser.add_argument("--no-task-cache", dest="task_cache", action="store_false", help="serve check_tasks without the task cache")
+    parser.add_argument("--codec", choices=["msgpack", "json", "legacy"], default="msgpack",
+                        help="wire format of the requests, legacy is a single JSON frame")
+    parser.add_argument("--todoist-port", type=int, default=7001)
+    parser.add_argument("--google-sheet-port", type=int, default=7002)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{'method':<15}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for method, stats in results["methods"].items():
+        if not stats["count"]:
+            continue
+        print(f"{method:<15}{stats['count']:>8}{stats['errors']:>8}{stats['throughput']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+'''
+Gateway broker: one port for every service, requests are routed by method.
+
+Clients send the same REQ requests they send to a server to GATEWAY_PORT. Servers
+started with GATEWAY_BACKEND_URL=tcp://<gateway>:<GATEWAY_BACKEND_PORT> connect a DEALER
+socket to the gateway and announce [b"", b"READY", service, json list of methods,
+json list of write methods] every GATEWAY_HEARTBEAT seconds. The gateway keeps a
+registry of the live instances, sends each read to the instance of its method with the
+fewest requests in flight, and forgets instances that stop announcing themselves.
+
+Writes of a service all go to one instance, the one registered first that is still
+alive. The duplicate checks of the servers (e.g. insert_person) only see their own
+process, two instances taking writes would both accept the same person. Adding a server on another node is
+just starting it with GATEWAY_BACKEND_URL, no client changes.
+
+A method served by several services (status) needs "service" in the request, the
+clients built from methods.py always send it.
+
+Usage:
+    python gateway.py
+'''
+
+import itertools
+import json
+import os
+import time
+import zmq
+
+import wire
+from metrics import Counter, Gauge, start_metrics_server
+from mq_server import HEARTBEAT_INTERVAL, logger, send_reply, setup_logging
+
+# Instances that miss this many heartbeats in a row are dropped
+HEARTBEAT_LIVENESS = 3
+
+ROUTED = Counter("gateway_requests_total", "Requests routed to a server.", ["service", "method"])
+UNROUTABLE = Counter("gateway_unroutable_total", "Requests answered with an error by the gateway.", ["method"])
+INSTANCES = Gauge("gateway_instances", "Live server instances.", ["service"])
+
+class Instance:
+    def __init__(self, identity, service, methods, order=0):
+        self.identity = identity
+        self.service = service
+        self.methods = set(methods)
+        self.writes = set()
+        # Registration order, the oldest live instance of a service takes its writes
+        self.order = order
+        self.in_flight = 0
+        self.last_picked = 0
+        self.expires_at = 0.0
+
+class Registry:
+    """Live server instances by ROUTER identity, and the methods every service has announced"""
+    def __init__(self, liveness=HEARTBEAT_INTERVAL * HEARTBEAT_LIVENESS):
+        self.liveness = liveness
+        self.instances = {}
+        self.known = {}
+        self._picks = itertools.count(1)
+        self._registrations = itertools.count()
+
+    def register(self, identity, service, methods, writes=()):
+        """Add or refresh an instance, return True if it is new"""
+        instance = self.instances.get(identity)
+        is_new = instance is None or instance.service != service
+        if is_new:
+            instance = self.instances[identity] = Instance(identity, service, methods, next(self._registrations))
+            self._update_gauge(service)
+        instance.methods = set(methods)
+        instance.writes = set(writes)
+        instance.expires_at = time.monotonic() + self.liveness
+        self.known.setdefault(service, set()).update(methods)
+        return is_new
+
+    def remove(self, identity):
+        instance = self.instances.pop(identity, None)
+        if instance:
+            self._update_gauge(instance.service)
+        return instance
+
+    def expire(self):
+        """Drop the instances whose heartbeat is overdue and return them"""
+        now = time.monotonic()
+        expired = [identity for identity, instance in self.instances.items() if instance.expires_at < now]
+        return [self.remove(identity) for identity in expired]
+
+    def pick(self, method, service=None):
+        """Instance for a request, raise LookupError with the message for the client if there is none"""
+        services = {name for name, methods in self.known.items() if method in methods}
+        if service:
+            if service not in services:
+                raise LookupError(f"Method '{method}' not found")
+            services = {service}
+        elif len(services) > 1:
+            raise LookupError(f"Method '{method}' is served by {', '.join(sorted(services))}, set 'service' in the request")
+        elif not services:
+            raise LookupError(f"Method '{method}' not found")
+
+        candidates = [instance for instance in self.instances.values()
+                      if instance.service in services and method in instance.methods]
+        if not candidates:
+            raise LookupError(f"No server for '{method}' is available")
+        if any(method in instance.writes for instance in candidates):
+            instance = min(candidates, key=lambda instance: instance.order)
+        else:
+            instance = min(candidates, key=lambda instance: (instance.in_flight, instance.last_picked))
+        instance.last_picked = next(self._picks)
+        return instance
+
+    def _update_gauge(self, service):
+        INSTANCES.set(sum(1 for instance in self.instances.values() if instance.service == service), service=service)
+
+def parse_announcement(frames):
+    """(service, methods, write methods) of a READY message, None if it is malformed"""
+    try:
+        service = frames[2].decode()
+        methods = json.loads(frames[3])
+        # Servers from before write routing announce no write methods
+        writes = json.loads(frames[4]) if len(frames) > 4 else []
+    except (IndexError, UnicodeDecodeError, ValueError):
+        return None
+    if not (isinstance(methods, list) and isinstance(writes, list)
+            and all(isinstance(method, str) for method in methods + writes)):
+        return None
+    return service, methods, writes
+
+def route(frontend, backend, registry, frames):
+    """Forward one client request [client envelope..., b"", body...] to a server"""
+    try:
+        delimiter = frames.index(b"")
+    except ValueError:
+        # Not a REQ style request, there is nobody to answer
+        return
+    envelope, body = frames[:delimiter + 1], frames[delimiter + 1:]
+    codec, method = None, None
+    try:
+        codec, request = wire.decode_request(body)
+        method = request.get("method")
+        while True:
+            instance = registry.pick(method, request.get("service"))
+            try:
+                backend.send_multipart([instance.identity] + frames)
+                break
+            except zmq.ZMQError:
+                # The server went away before its heartbeat expired
+                registry.remove(instance.identity)
+    except Exception as e:
+        UNROUTABLE.inc(method=str(method))
+        message = str(e) if isinstance(e, LookupError) else f"Server error: {str(e)}"
+        send_reply(frontend, envelope, codec, {"success": False, "error": message})
+        return
+    instance.in_flight += 1
+    ROUTED.inc(service=instance.service, method=method)
+
+def serve(port, backend_port, metrics_port=None):
+    setup_logging()
+    context = zmq.Context()
+    frontend = context.socket(zmq.ROUTER)
+    frontend.bind(f"tcp://*:{port}")
+    backend = context.socket(zmq.ROUTER)
+    # Fail loudly instead of dropping requests for an instance that disconnected
+    backend.setsockopt(zmq.ROUTER_MANDATORY, 1)
+    backend.bind(f"tcp://*:{backend_port}")
+    registry = Registry()
+
+    if metrics_port:
+        start_metrics_server(metrics_port)
+        print(f"Gateway metrics on http://localhost:{metrics_port}/metrics")
+
+    print(f"Gateway started. Clients on port {port}, servers register on port {backend_port}...")
+
+    poller = zmq.Poller()
+    poller.register(frontend, zmq.POLLIN)
+    poller.register(backend, zmq.POLLIN)
+    try:
+        while True:
+            events = dict(poller.poll(HEARTBEAT_INTERVAL * 1000))
+            if events.get(backend) == zmq.POLLIN:
+                identity, *frames = backend.recv_multipart()
+                if frames[:2] == [b"", b"READY"]:
+                    announcement = parse_announcement(frames)
+                    if announcement is None:
+                        logger.info("bad_announcement", extra={"fields": {"frames": len(frames)}})
+                    elif registry.register(identity, *announcement):
+                        service, methods, _ = announcement
+                        logger.info("registered", extra={"fields": {"service": service, "methods": methods}})
+                else:
+                    instance = registry.instances.get(identity)
+                    if instance:
+                        instance.in_flight = max(0, instance.in_flight - 1)
+                    frontend.send_multipart(frames)
+            if events.get(frontend) == zmq.POLLIN:
+                route(frontend, backend, registry, frontend.recv_multipart())
+            for instance in registry.expire():
+                logger.info("expired", extra={"fields": {"service": instance.service}})
+    except KeyboardInterrupt:
+        print("\nShutting down gateway...")
+    finally:
+        frontend.close(linger=0)
+        backend.close(linger=0)
+        context.term()
+
+def main():
+    port = int(os.getenv("GATEWAY_PORT", "6000"))
+    backend_port = int(os.getenv("GATEWAY_BACKEND_PORT", "6100"))
+    metrics_port = int(os.getenv("GATEWAY_METRICS_PORT", "8083"))
+    serve(port, backend_port, metrics_port)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,97 @@
+import functools
+import json
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from metrics import upstream
+from rate_limit import get_limiter
+from search_index import NameSearchIndex
+
+# The google client libraries take a few hundred milliseconds to import, they are
+# imported where they are first used so the server can start answering before that
 
 # The ID and range of your spreadsheet.
 load_dotenv()
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 RANGE_NAME = 'Sheet1!A:C' # A, B, C for 'name', 'age', 'occupation'
+# Seconds the local replica of the sheet is trusted before it is downloaded again
+SHEET_CACHE_TTL = float(os.getenv("SHEET_CACHE_TTL", "60"))
+# Authorized HTTP connections kept open to the Sheets API, and their socket timeout in seconds
+SHEET_HTTP_POOL_SIZE = int(os.getenv("SHEET_HTTP_POOL_SIZE", "8"))
+SHEET_HTTP_TIMEOUT = float(os.getenv("SHEET_HTTP_TIMEOUT", "30"))
+
+@functools.lru_cache(maxsize=None)
+def discovery_document():
+    """
+    Sheets v4 discovery document bundled with googleapiclient, parsed once per process
+    and shared by the service objects of all threads. None if it is not bundled.
+    """
+    from googleapiclient.discovery_cache import get_static_doc
+    document = get_static_doc("sheets", "v4")
+    return json.loads(document) if document else None
+
+class HttpPool:
+    """
+    HTTP connections for the worker threads. httplib2 is not thread-safe, so a connection
+    is lent to one thread at a time; it stays open between requests, so a request does
+    not pay for a new TLS handshake. At most `size` connections exist, further callers wait.
+    """
+    def __init__(self, factory, size):
+        self.factory = factory
+        # LIFO so the most recently used connection, the one most likely still open, goes first
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(max(1, size))
+
+    @contextmanager
+    def connection(self):
+        with self._available:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = self.factory()
+            try:
+                yield http
+            finally:
+                self._idle.put(http)
 
 class GoogleSheetsAPI:
-    service = None
+    creds = None
 
     def __init__(self):
+        self._http_pool = HttpPool(self.new_http, SHEET_HTTP_POOL_SIZE)
+        # Sheets quota shared by all threads, reads go first
+        self._limiter = get_limiter("sheets")
+        # Only one thread refreshes the shared credentials, the others wait for it
+        self._credentials_lock = threading.Lock()
+        # Local replica of the sheet, see load_index
+        self._headers = []
+        self._index = {}
+        self._index_loaded_at = None
+        self._pending_names = set()
+        # Rows appended while a download is in flight, which its snapshot may not have
+        self._reloads_in_flight = 0
+        self._appended_during_reload = []
+        # Trigram index over the names of the replica, see search_people
+        self._search_index = NameSearchIndex()
+        self._index_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.creds = self.get_credentials()
         self.service = self.get_google_sheets_service()
         if not self.service:
             raise RuntimeError("Failed to initialize Google Sheets service.")
 
-    def get_google_sheets_service(self):
+    def get_credentials(self):
         """
-        Authenticates and returns a service object to interact with the Google Sheets API.
-        This function should be called once to get the service object for all subsequent
-        API calls.
+        Loads the stored user credentials, refreshing or running the OAuth flow when needed.
+        The credentials are shared by all pooled connections.
         """
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
         SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
         creds = None
         token_path = 'google_tokens/token.json'
@@ -37,68 +105,216 @@ class GoogleSheetsAPI:
                 creds = flow.run_local_server(port=0, open_browser=False)
             with open(token_path, 'w') as token:
                 token.write(creds.to_json())
+        return creds
+
+    def get_google_sheets_service(self):
+        """
+        Returns a service object to interact with the Google Sheets API.
+        It is shared by all threads: it only builds the requests, which are sent over
+        a pooled connection by _execute.
+        """
+        from googleapiclient.discovery import build, build_from_document
 
         try:
-            service = build('sheets', 'v4', credentials=creds)
+            document = discovery_document()
+            if document:
+                service = build_from_document(document, http=self.new_http())
+            else:
+                service = build('sheets', 'v4', http=self.new_http(), static_discovery=False)
             return service
         except Exception as error:
             print(f"An error occurred: {error}")
             return None
 
-    def find_person_by_name(self, name_to_find):
+    def new_http(self):
+        """A new authorized HTTP connection for the pool"""
+        import google_auth_httplib2
+        import httplib2
+
+        return google_auth_httplib2.AuthorizedHttp(self.creds, http=httplib2.Http(timeout=SHEET_HTTP_TIMEOUT))
+
+    def _refresh_credentials(self):
+        """Refreshes expired credentials once for all threads, before a request would do it on its own."""
+        if self.creds is None or self.creds.valid:
+            return
+        from google.auth.transport.requests import Request
+
+        with self._credentials_lock:
+            if not self.creds.valid:
+                self.creds.refresh(Request())
+
+    def _execute(self, request):
+        """Sends a request built on the service over a pooled connection, within the Sheets quota."""
+        def send():
+            self._refresh_credentials()
+            with self._http_pool.connection() as http:
+                with upstream("sheets"):
+                    return request.execute(http=http)
+        return self._limiter.call(send, write=getattr(request, "method", "GET") != "GET")
+
+    def load_index(self):
         """
-        Checks if a name exists in the spreadsheet.
-        Returns the person's data as a dictionary if found, otherwise returns None.
+        Downloads the whole range once and rebuilds the local replica of the sheet,
+        a dictionary of rows keyed on the lowercased name.
         """
-        sheet = self.service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME).execute()
+        with self._index_lock:
+            self._reloads_in_flight += 1
+            mark = len(self._appended_during_reload)
+        try:
+            sheet = self.service.spreadsheets()
+            result = self._execute(sheet.values().get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME))
+        except BaseException:
+            with self._index_lock:
+                self._end_reload()
+            raise
         values = result.get('values', [])
-        
-        if not values:
-            return None
 
-        headers = values[0]
-        existing_rows = values[1:]
-        
-        try:
+        headers = values[0] if values else []
+        index = {}
+        if 'name' in headers:
             name_col_index = headers.index('name')
-        except ValueError:
+            for row in values[1:]:
+                if len(row) > name_col_index:
+                    # Keep the first match, like a top to bottom scan of the sheet would
+                    index.setdefault(row[name_col_index].lower(), dict(zip(headers, row)))
+        elif values:
             print("Error: 'name' column not found in the sheet headers.")
-            return None
 
-        for row in existing_rows:
-            if len(row) > name_col_index and row[name_col_index].lower() == name_to_find.lower():
-                return dict(zip(headers, row))
-        
-        return None
+        with self._index_lock:
+            # An insert that finished during the download may be missing from the snapshot,
+            # keep its row or the next insert of that name would pass the duplicate check
+            for key, person in self._appended_during_reload[mark:]:
+                index.setdefault(key, person)
+            self._end_reload()
+            self._headers = headers
+            self._index = index
+            self._index_loaded_at = time.monotonic()
+            # Only the names that changed since the last download are re-indexed. Under the
+            # lock, so a row added in the meantime is not dropped from the search index
+            self._search_index.sync(index)
+
+    def _end_reload(self):
+        """Called with _index_lock held when a download is over, whether it succeeded or not."""
+        self._reloads_in_flight -= 1
+        if not self._reloads_in_flight:
+            self._appended_during_reload = []
+
+    def invalidate_index(self):
+        """Forces the next lookup to download the sheet again."""
+        with self._index_lock:
+            self._index_loaded_at = None
+
+    def _ensure_index(self):
+        """Loads the replica on first use and again once it is older than SHEET_CACHE_TTL."""
+        loaded_at = self._index_loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < SHEET_CACHE_TTL:
+            return
+        # Only one thread downloads the sheet, the others wait for its result
+        with self._refresh_lock:
+            loaded_at = self._index_loaded_at
+            if loaded_at is None or time.monotonic() - loaded_at >= SHEET_CACHE_TTL:
+                self.load_index()
+
+    def find_person_by_name(self, name_to_find):
+        """
+        Checks if a name exists in the spreadsheet.
+        Returns the person's data as a dictionary if found, otherwise returns None.
+        """
+        self._ensure_index()
+        person = self._index.get(name_to_find.lower())
+        return dict(person) if person else None
+
+    def search_people(self, query, limit=5):
+        """
+        Finds the people whose name is closest to query, for misspelled or partial names.
+        Returns a list of {"person": {...}, "score": ...} ranked by score, 1.0 is an exact match.
+        """
+        self._ensure_index()
+        results = []
+        for key, score in self._search_index.search(query, limit):
+            person = self._index.get(key)
+            if person:
+                results.append({"person": dict(person), "score": round(score, 3)})
+        return results
 
     def insert_person_data(self, name, age=None, occupation=None):
         """
         Checks if a person exists by name. If not, it inserts a new entry.
         Returns the person's data if found, or the newly inserted data.
         """
-        found_person = self.find_person_by_name(name)
-
-        if found_person:
-            raise ValueError(f"Person '{name}' already exists in the sheet.")
-        else:
-            if age is None or occupation is None:
-                raise ValueError("Age and Occupation must be provided for a new entry.")
-            
-            new_row = [name, age, occupation]
-            body = {'values': [new_row]}
+        result = self.insert_people_data([{"name": name, "age": age, "occupation": occupation}])[0]
+        if not result["inserted"]:
+            raise ValueError(result["error"])
+        return result["result"]
+
+    def insert_people_data(self, people):
+        """
+        Inserts a list of people, given as dictionaries with 'name', 'age' and 'occupation',
+        with a single append call. Every row is checked for duplicates against the replica,
+        so the whole batch costs at most one sheet read.
+        Returns one result per person, in order: {"inserted": True, "result": {...}} or
+        {"inserted": False, "error": "..."} for rows that were rejected.
+        """
+        self._ensure_index()
+
+        results = []
+        new_rows = []
+        reserved = []
+        # Reserve the names so concurrent inserts of the same person cannot both pass the check
+        with self._index_lock:
+            for person in people:
+                name = person.get("name")
+                age = person.get("age")
+                occupation = person.get("occupation")
+                if not name:
+                    results.append({"inserted": False, "error": "Name must be provided for a new entry."})
+                    continue
+                key = name.lower()
+                if key in self._index or key in self._pending_names:
+                    results.append({"inserted": False, "error": f"Person '{name}' already exists in the sheet."})
+                    continue
+                if age is None or occupation is None:
+                    results.append({"inserted": False, "error": "Age and Occupation must be provided for a new entry."})
+                    continue
+                self._pending_names.add(key)
+                reserved.append(key)
+                new_rows.append([name, age, occupation])
+                results.append({"inserted": True, "result": {"name": name, "age": age, "occupation": occupation}})
+
+        if not new_rows:
+            return results
+
+        try:
+            body = {'values': new_rows}
             sheet = self.service.spreadsheets()
-            result = sheet.values().append(
+            result = self._execute(sheet.values().append(
                 spreadsheetId=SPREADSHEET_ID,
                 range=RANGE_NAME,
                 valueInputOption='RAW',
                 insertDataOption='INSERT_ROWS',
                 body=body
-            ).execute()
+            ))
             if result.get('updates', {}).get('updatedRows', 0) > 0:
-                return {"name": name, "age": age, "occupation": occupation}
+                for row in new_rows:
+                    self._add_to_index(row)
+                return results
             else:
                 raise RuntimeError("Failed to insert new person data.")
+        finally:
+            with self._index_lock:
+                self._pending_names.difference_update(reserved)
+
+    def _add_to_index(self, row):
+        """Updates the replica in place with a row that was appended to the sheet."""
+        with self._index_lock:
+            headers = self._headers or ['name', 'age', 'occupation']
+            # Store the values the way the sheet returns them on a read
+            person = dict(zip(headers, [str(value) for value in row]))
+            key = str(row[0]).lower()
+            self._index.setdefault(key, person)
+            if self._reloads_in_flight:
+                self._appended_during_reload.append((key, person))
+        self._search_index.add(str(row[0]))
 
 
 # --- Main script execution ---
@@ -1,95 +1,178 @@
-import zmq
-import json
+import os
+import threading
+from concurrent.futures import Future
 
 from google_sheet_api import GoogleSheetsAPI
-sheet_api = GoogleSheetsAPI()
+from mq_server import serve, logger
+
+# Created by init_sheet_api, a test or benchmark may set its own client before main() runs
+sheet_api = None
+
+# Window in milliseconds to gather concurrent insert_person requests into one append, 0 disables it
+INSERT_COALESCE_MS = int(os.getenv("SHEET_INSERT_COALESCE_MS", "0"))
+
+class InsertCoalescer:
+    """
+    Gathers single inserts that arrive within a short window into one insert_people_data call.
+    The first caller of a window becomes the leader: it waits for the window to close,
+    writes the whole batch with one append and hands every caller its own result.
+
+    Every waiting caller holds a server worker thread, so a batch can never grow beyond
+    the number of workers, and reads wait for a free worker meanwhile. The window
+    therefore closes early once max_batch inserts have gathered.
+    """
+    def __init__(self, insert_many, window, max_batch):
+        self.insert_many = insert_many
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._batch = None
+        self._full = None
+
+    def insert(self, person):
+        future = Future()
+        with self._lock:
+            leader = self._batch is None
+            if leader:
+                self._batch = []
+                self._full = full = threading.Event()
+            self._batch.append((person, future))
+            if len(self._batch) >= self.max_batch:
+                self._full.set()
+
+        if leader:
+            full.wait(self.window)
+            with self._lock:
+                batch, self._batch = self._batch, None
+            try:
+                results = self.insert_many([person for person, _ in batch])
+                for (_, waiter), result in zip(batch, results):
+                    waiter.set_result(result)
+            except Exception as e:
+                for _, waiter in batch:
+                    waiter.set_exception(e)
+
+        return future.result()
+
+insert_coalescer = None
+
+# Set once the background initialisation started by start_sheet_api has finished
+sheet_api_ready = threading.Event()
+sheet_api_error = None
+# Seconds a request waits for the Google Sheets client while the server is starting
+SHEET_INIT_TIMEOUT = float(os.getenv("SHEET_INIT_TIMEOUT", "30"))
+
+def server_workers():
+    """Number of worker threads, each one can hold an upstream API call in flight"""
+    return int(os.getenv("GOOGLE_SHEET_MQ_WORKERS", "4"))
+
+def init_sheet_api():
+    """Create the Google Sheets client unless one was set already, and the optional insert coalescer"""
+    global sheet_api, insert_coalescer
+    if sheet_api is None:
+        sheet_api = GoogleSheetsAPI()
+    if INSERT_COALESCE_MS > 0:
+        # Leave a worker for reads while inserts gather
+        insert_coalescer = InsertCoalescer(sheet_api.insert_people_data, INSERT_COALESCE_MS / 1000,
+                                           server_workers() - 1)
+
+def start_sheet_api():
+    """
+    Run init_sheet_api in a background thread, so the server binds and answers status
+    while the Google libraries are imported and the credentials are loaded.
+    """
+    def run():
+        global sheet_api_error
+        try:
+            init_sheet_api()
+        except Exception as e:
+            sheet_api_error = e
+            logger.error("sheet_api_failed", extra={"fields": {"error": str(e)}})
+        finally:
+            sheet_api_ready.set()
+    threading.Thread(target=run, name="Google Sheets init", daemon=True).start()
+
+def get_sheet_api():
+    """The Google Sheets client, waits for its initialisation if it is still running"""
+    if not sheet_api_ready.wait(SHEET_INIT_TIMEOUT):
+        raise RuntimeError("Google Sheets client is still starting, try again shortly.")
+    if sheet_api_error:
+        raise RuntimeError(f"Google Sheets client failed to start: {sheet_api_error}")
+    return sheet_api
 
 def get_status():
     """Get server status"""
-    return {"status": "ok", "message": "Server is running"}
+    if not sheet_api_ready.is_set():
+        sheets = "starting"
+    elif sheet_api_error:
+        sheets = f"failed: {sheet_api_error}"
+    else:
+        sheets = "ready"
+    return {"status": "ok", "message": "Server is running", "sheets": sheets}
 
 def find_person(name):
     """Find a person by name in the Google Sheet"""
     try:
-        person = sheet_api.find_person_by_name(name)
+        api = get_sheet_api()
+        person = api.find_person_by_name(name)
         if person:
             return {"found": True, "person": person}
         else:
-            return {"found": False, "message": f"Person '{name}' not found."}
+            # Close names save the client a retry with a corrected name
+            suggestions = [result["person"].get("name") for result in api.search_people(name, 3)]
+            return {"found": False, "message": f"Person '{name}' not found.", "suggestions": suggestions}
     except Exception as e:
         raise RuntimeError(f"Failed to find person: {str(e)}")
     
+def search_people(query):
+    """Find people by a partial or misspelled name, best matches first"""
+    try:
+        return {"results": get_sheet_api().search_people(query)}
+    except Exception as e:
+        raise RuntimeError(f"Failed to search people: {str(e)}")
+
 def insert_person(name, age, occupation):
     """Insert a new person into the Google Sheet"""
     try:
-        print("Inserting person:", name, age, occupation)
-        result = sheet_api.insert_person_data(name, age, occupation)
+        logger.debug("insert_person", extra={"fields": {"name": name}})
+        api = get_sheet_api()
+        if insert_coalescer:
+            outcome = insert_coalescer.insert({"name": name, "age": age, "occupation": occupation})
+            if not outcome["inserted"]:
+                raise ValueError(outcome["error"])
+            result = outcome["result"]
+        else:
+            result = api.insert_person_data(name, age, occupation)
         return {"inserted": True, "result": result}
     except Exception as e:
         raise RuntimeError(f"Failed to insert person: {str(e)}")
+
+def insert_people(people):
+    """Insert a list of people into the Google Sheet with a single append"""
+    try:
+        logger.debug("insert_people", extra={"fields": {"count": len(people)}})
+        results = get_sheet_api().insert_people_data(people)
+        return {"inserted": sum(1 for r in results if r["inserted"]), "results": results}
+    except Exception as e:
+        raise RuntimeError(f"Failed to insert people: {str(e)}")
     
-def main():
-    # Setup ZeroMQ context and socket
-    context = zmq.Context()
-    socket = context.socket(zmq.REP)
-    socket.bind("tcp://*:6002")
-    
-    print("Google Sheets Server started. Listening on port 6002...")
-    
+def main(port=None):
+    start_sheet_api()
+
     # Function mapping
-    try:
-        api_functions = {
-            "status": get_status,
-            "find_person": find_person,
-            "insert_person": insert_person
-        }
-        
-        while True:
-            try:
-                # Receive request
-                message = socket.recv_string()
-                print(f"Received request: {message}")
-                
-                # Parse JSON request
-                request = json.loads(message)
-                method = request.get("method")
-                params = request.get("params", {})
-                
-                # Process request
-                if method in api_functions:
-                    try:
-                        result = api_functions[method](**params)
-                        response = {
-                            "success": True,
-                            "result": result
-                        }
-                    except Exception as e:
-                        response = {
-                            "success": False,
-                            "error": str(e)
-                        }
-                else:
-                    response = {
-                        "success": False,
-                        "error": f"Method '{method}' not found"
-                    }
-                
-                # Send response
-                socket.send_string(json.dumps(response))
-                
-            except Exception as e:
-                # Handle unexpected errors during request processing
-                error_response = {
-                    "success": False,
-                    "error": f"Server error: {str(e)}"
-                }
-                socket.send_string(json.dumps(error_response))
-    except KeyboardInterrupt:
-        print("\nShutting down Google Sheets server...")
-    finally:
-        # Ensure the socket and context are closed on exit
-        socket.close()
-        context.term()
+    api_functions = {
+        "status": get_status,
+        "find_person": find_person,
+        "search_people": search_people,
+        "insert_person": insert_person,
+        "insert_people": insert_people
+    }
+
+    port = port or int(os.getenv("GOOGLE_SHEET_MQ_PORT", "6002"))
+    metrics_port = int(os.getenv("GOOGLE_SHEET_METRICS_PORT", "8082"))
+    serve(api_functions, port, "Google Sheets", server_workers(), metrics_port,
+          service="google_sheet", read_methods=["find_person", "search_people"],
+          write_methods=["insert_person", "insert_people"])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
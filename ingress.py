@@ -0,0 +1,251 @@
+'''
+HTTP ingress in front of the LLM and dispatch pipeline.
+
+A long-running asyncio service that keeps one warm pipeline for every caller: the
+backend connections (app_async.AsyncClient), the preloaded Ollama model and a pool of
+parse workers that turn queries into requests.
+
+Endpoints, all JSON:
+    POST /query     {"query": "..."}                  parse with the LLM, then dispatch
+    POST /dispatch  {"method": "...", "params": {}}   dispatch without the LLM
+    GET  /health    requests in flight and queued parses
+    GET  /metrics   Prometheus metrics
+
+At most INGRESS_MAX_IN_FLIGHT requests are handled at once, the next ones are answered
+429 with Retry-After right away instead of queueing without bound. Parsing is further
+limited to INGRESS_PARSE_WORKERS queries at a time, since the LLM is the slow part,
+while /dispatch requests never wait for it.
+
+start_server.py runs and restarts it along with the servers.
+
+Usage:
+    python ingress.py
+    curl -d '{"query": "Who is Alice Smith?"}' localhost:8080/query
+'''
+
+import asyncio
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from app_async import AsyncClient
+from methods import validate_request
+from metrics import Counter, Gauge, Histogram
+
+load_dotenv()
+
+INGRESS_PORT = int(os.getenv("INGRESS_PORT", "8080"))
+INGRESS_MAX_IN_FLIGHT = int(os.getenv("INGRESS_MAX_IN_FLIGHT", "64"))
+INGRESS_PARSE_WORKERS = int(os.getenv("INGRESS_PARSE_WORKERS", "8"))
+INGRESS_MODEL = os.getenv("INGRESS_MODEL", "llama3.2")
+# Seconds a rejected client is asked to wait before trying again
+RETRY_AFTER = 1
+MAX_BODY = 64 * 1024
+
+REQUESTS = Counter("ingress_requests_total", "HTTP requests handled by the ingress.", ["path", "status"])
+REJECTED = Counter("ingress_rejected_total", "Requests answered 429 because the ingress was saturated.")
+IN_FLIGHT = Gauge("ingress_in_flight", "Requests being handled by the ingress.")
+DURATION = Histogram("ingress_request_duration_seconds", "Time to answer a request.", ["path"])
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 422: "Unprocessable Content",
+           429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway",
+           503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Ingress:
+    def __init__(self, client, max_in_flight=INGRESS_MAX_IN_FLIGHT, parse_workers=INGRESS_PARSE_WORKERS):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.parse_workers = parse_workers
+        self.in_flight = 0
+        # Never more than max_in_flight entries, the in-flight limit bounds it
+        self.parse_queue = asyncio.Queue()
+        self.workers = []
+
+    def start(self):
+        self.workers = [asyncio.ensure_future(self.parse_worker()) for _ in range(self.parse_workers)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def parse_worker(self):
+        while True:
+            query, future = await self.parse_queue.get()
+            if future.done():
+                # The client disconnected while the query was queued
+                continue
+            try:
+                future.set_result(await self.client.parser.parse(query))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def parse(self, query):
+        future = asyncio.get_running_loop().create_future()
+        self.parse_queue.put_nowait((query, future))
+        return await future
+
+    async def handle(self, method, path, body):
+        """Return (status, payload) of one HTTP request"""
+        if path == "/health":
+            return 200, {"status": "ok", "in_flight": self.in_flight, "queued_parses": self.parse_queue.qsize()}
+        if path not in ("/query", "/dispatch"):
+            raise HTTPError(404, f"No endpoint {path}.")
+        if method != "POST":
+            raise HTTPError(405, f"{path} only accepts POST.")
+        if self.in_flight >= self.max_in_flight:
+            REJECTED.inc()
+            raise HTTPError(429, "Too many requests in flight, try again later.")
+
+        self.in_flight += 1
+        IN_FLIGHT.set(self.in_flight)
+        try:
+            try:
+                payload = json.loads(body)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                raise HTTPError(400, "The body is not valid JSON.")
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "The body must be a JSON object.")
+
+            if path == "/dispatch":
+                return 200, await self.client.send_request_to_server(json.dumps(payload))
+            query = payload.get("query")
+            if not isinstance(query, str) or not query.strip():
+                raise HTTPError(400, "'query' must be a non-empty string.")
+            request = await self.parse(query)
+            try:
+                parsed = json.loads(request)
+            except (json.JSONDecodeError, TypeError):
+                parsed = None
+            if not isinstance(parsed, dict):
+                # Our failure, not the client's: the model's answer stayed unusable after the re-prompt
+                raise HTTPError(502, "The language model did not return a valid request, try rephrasing the query.")
+            if "error" in parsed and "method" not in parsed:
+                # The model found no method for the query
+                raise HTTPError(422, parsed["error"])
+            try:
+                validate_request(parsed)
+            except ValueError as e:
+                # Also ours, e.g. a method the model made up
+                raise HTTPError(502, f"The language model returned an invalid request: {e}")
+            response = await self.client.send_request_to_server(request)
+            return 200, {"request": parsed, "response": response}
+        finally:
+            self.in_flight -= 1
+            IN_FLIGHT.set(self.in_flight)
+
+    async def respond(self, method, path, body):
+        """handle() with its exceptions turned into error responses"""
+        try:
+            return await self.handle(method, path, body)
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except ValueError as e:
+            # Invalid requests, e.g. an unsupported method or missing params
+            return 400, {"error": str(e)}
+        except (TimeoutError, ConnectionError) as e:
+            # A backend or Ollama is down, or its circuit breaker is open
+            return 503, {"error": str(e)}
+        except Exception as e:
+            print(f"Error handling {method} {path}: {e}")
+            return 500, {"error": "Internal server error."}
+
+    async def serve_connection(self, reader, writer):
+        """Answer the HTTP/1.1 requests of one connection, keeping it open between them"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.write(writer, 400, {"error": "Malformed request line."}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+
+                path = target.split("?")[0]
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.write(writer, 400, {"error": "Invalid Content-Length."}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.write(writer, 413, {"error": f"The body is larger than {MAX_BODY} bytes."}, False)
+                    break
+                body = await reader.readexactly(length)
+
+                start = time.perf_counter()
+                if path == "/metrics" and method == "GET":
+                    status, payload = 200, metrics.render().encode()
+                else:
+                    status, payload = await self.respond(method, path, body)
+                DURATION.observe(time.perf_counter() - start, path=path)
+                REQUESTS.inc(path=path, status=str(status))
+                await self.write(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # The client went away or sent a broken request, there is nobody to answer
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def write(writer, status, payload, keep_alive):
+        if isinstance(payload, bytes):
+            body, content_type = payload, "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        headers = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                   f"Content-Type: {content_type}",
+                   f"Content-Length: {len(body)}",
+                   f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if status == 429:
+            headers.append(f"Retry-After: {RETRY_AFTER}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(port=INGRESS_PORT, model=INGRESS_MODEL):
+    client = AsyncClient(max_in_flight=INGRESS_MAX_IN_FLIGHT, model=model)
+    ingress = Ingress(client)
+    try:
+        if not await client.preload():
+            print("Model not preloaded, it is loaded on the first query.")
+        ingress.start()
+        server = await asyncio.start_server(ingress.serve_connection, port=port)
+        print(f"Ingress listening on port {port}...")
+        async with server:
+            await server.serve_forever()
+    finally:
+        await ingress.stop()
+        client.close()
+
+def main():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("Ingress stopped.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+'''
+Deterministic pre-parser for the supported methods.
+Well structured queries such as "Check my tasks in Todoist" are turned into the request
+json with a few regular expressions, only queries it is not confident about go to the LLM.
+'''
+
+import os
+import re
+import threading
+
+# Requests below this confidence are left to the LLM
+MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+
+QUOTED = r"""['"‘’“”]([^'"‘’“”]+)['"‘’“”]"""
+# Capitalised words, case sensitive even inside patterns compiled with re.I
+NAME = r"(?-i:([A-Z][\w'\-]*(?:\s+[A-Z][\w'\-]*)*))"
+
+STATUS_RE = re.compile(r"\b(status|health|running|alive|up and running)\b", re.I)
+STATUS_TARGET_RE = re.compile(r"\b(servers?|todoist|google sheets?|services?|backends?)\b", re.I)
+# A status request asks about the state of the servers: "What is the status of ...",
+# "Is Todoist running?", "Check the health of the servers"
+STATUS_SHAPE_RE = re.compile(
+    r"^\s*(?:(?:please|kindly)\s+)?(?:what(?:'s|\s+is|\s+are)?|how(?:'s|\s+is|\s+are)?|is|are|check|show|get|give|tell|report)\b",
+    re.I)
+# Tasks or people in a status query point to another method ("the status of my task list")
+# or to no method at all ("Who is running the servers?")
+STATUS_OTHER_TOPIC_RE = re.compile(r"\b(tasks?|task\s+list|to-?dos?|person|people|who|whom|whose)\b", re.I)
+CHECK_TASKS_RE = re.compile(r"\b(check|show|list|get|see|view|what are|display)\b.*\b(tasks|todos|to-dos)\b", re.I)
+ADD_TASK_RE = re.compile(r"\b(add|create|new)\b.*\btask\b", re.I)
+TASK_CONTENT_RE = re.compile(r"\b(?:content|titled|called)\s*:?\s*" + QUOTED, re.I)
+TASK_DESCRIPTION_RE = re.compile(r"\bdescription\s*:?\s*" + QUOTED, re.I)
+TASK_DUE_RE = re.compile(r"\bdue(?:_string| date| string)?\s*:?\s*" + QUOTED, re.I)
+INSERT_PERSON_RE = re.compile(r"\b(add|insert|create|register)\b.*\bperson\b", re.I)
+PERSON_NAMED_RE = re.compile(r"\bnamed\s+" + NAME)
+PERSON_AGE_RE = re.compile(r"\bage[d]?\s*:?\s*(\d{1,3})\b", re.I)
+PERSON_OCCUPATION_RE = re.compile(r"\boccupation\s*:?\s*([\w][\w \-]*?)\s*(?:[,.;!?]|$)", re.I)
+# Writes only go through the fast path as a command, "Add ..." or "Please add ...",
+# not when the verb is merely mentioned ("I said not to add ...")
+IMPERATIVE_WRITE_RE = re.compile(
+    r"^\s*(?:(?:please|kindly)\s+|(?:can|could|would|will)\s+you\s+(?:please\s+)?)?(?:add|insert|create|register)\b", re.I)
+# Negated or hedged queries are left to the LLM, a keyword match would miss the intent
+NEGATION_RE = re.compile(
+    r"\b(?:not|no|never|don'?t|doesn'?t|didn'?t|shouldn'?t|won'?t|cannot|can'?t|stop|cancel|"
+    r"maybe|perhaps|whether|if|might|should\s+i)\b|n't\b", re.I)
+FIND_PERSON_RE = re.compile(r"^\s*(?:who\s+is|find(?:\s+(?:a\s+)?person)?(?:\s+named)?|look\s+up|search\s+for)\s+" + NAME + r"\s*[?.!]?\s*$", re.I)
+
+_lock = threading.Lock()
+_stats = {"fast_path": 0, "llm": 0}
+
+def _match_status(query):
+    if not (STATUS_RE.search(query) and STATUS_TARGET_RE.search(query)):
+        return None, 0.0
+    if not STATUS_SHAPE_RE.match(query) or STATUS_OTHER_TOPIC_RE.search(query):
+        return None, 0.5
+    return {"method": "status", "params": {}}, 1.0
+
+def _match_check_tasks(query):
+    if CHECK_TASKS_RE.search(query) and not ADD_TASK_RE.search(query):
+        return {"method": "check_tasks", "params": {}}, 1.0
+    return None, 0.0
+
+def _match_add_task(query):
+    if not ADD_TASK_RE.search(query):
+        return None, 0.0
+    if not IMPERATIVE_WRITE_RE.match(query):
+        return None, 0.5
+    content = TASK_CONTENT_RE.search(query)
+    description = TASK_DESCRIPTION_RE.search(query)
+    due = TASK_DUE_RE.search(query)
+    if not (content and description and due):
+        # Clearly a new task, but the LLM has to work out the missing fields
+        return None, 0.5
+    return {
+        "method": "add_task",
+        "params": {
+            "content": content.group(1),
+            "description": description.group(1),
+            "due_string": due.group(1)
+        }
+    }, 1.0
+
+def _match_insert_person(query):
+    if not INSERT_PERSON_RE.search(query):
+        return None, 0.0
+    if not IMPERATIVE_WRITE_RE.match(query):
+        return None, 0.5
+    name = PERSON_NAMED_RE.search(query)
+    age = PERSON_AGE_RE.search(query)
+    occupation = PERSON_OCCUPATION_RE.search(query)
+    if not (name and age and occupation):
+        return None, 0.5
+    return {
+        "method": "insert_person",
+        "params": {
+            "name": name.group(1),
+            "age": int(age.group(1)),
+            "occupation": occupation.group(1)
+        }
+    }, 1.0
+
+def _match_find_person(query):
+    match = FIND_PERSON_RE.match(query)
+    if not match:
+        return None, 0.0
+    return {"method": "find_person", "params": {"name": match.group(1)}}, 1.0
+
+RULES = [_match_status, _match_check_tasks, _match_add_task, _match_insert_person, _match_find_person]
+
+def parse_intent(query):
+    """
+    Returns (request, confidence) for a natural language query.
+    request is a {"method": ..., "params": ...} dictionary, or None when no rule
+    produced a complete request. Queries that match more than one method, or that are
+    negated or hedged, get a low confidence so they are left to the LLM.
+    """
+    if NEGATION_RE.search(query):
+        return None, 0.0
+    matches = []
+    for rule in RULES:
+        request, confidence = rule(query)
+        if confidence > 0:
+            matches.append((request, confidence))
+    if len(matches) != 1:
+        return None, 0.0
+    return matches[0]
+
+def fast_parse(query, min_confidence=MIN_CONFIDENCE):
+    """Returns the request for query if the fast path is confident enough, otherwise None"""
+    request, confidence = parse_intent(query)
+    hit = request is not None and confidence >= min_confidence
+    with _lock:
+        _stats["fast_path" if hit else "llm"] += 1
+    return request if hit else None
+
+def fast_path_stats():
+    """How often queries were answered by the fast path instead of the LLM"""
+    with _lock:
+        total = _stats["fast_path"] + _stats["llm"]
+        return {
+            "fast_path": _stats["fast_path"],
+            "llm": _stats["llm"],
+            "hit_rate": _stats["fast_path"] / total if total else 0.0
+        }
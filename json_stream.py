@@ -0,0 +1,154 @@
+'''
+Incremental extraction and repair of the JSON object in LLM output.
+
+LLM output often wraps the object in prose or markdown fences. The scanner is fed the
+text as it arrives, tracks brace depth outside of strings, and returns the object as soon
+as its closing brace is seen, so the rest of the generation can be skipped.
+repair_json fixes the near-valid objects models produce when they are not constrained.
+'''
+
+import ast
+import json
+import re
+
+class JSONObjectScanner:
+    def __init__(self):
+        self.text = ""
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._position = 0
+
+    def feed(self, chunk):
+        """Add a chunk of text, return the first complete JSON object as a string or None"""
+        self.text += chunk
+        while self._position < len(self.text):
+            char = self.text[self._position]
+            self._position += 1
+            if self._start is None:
+                if char == "{":
+                    self._start = self._position - 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.text[self._start:self._position]
+                    if self._is_object(candidate):
+                        return candidate
+                    # Not JSON, e.g. braces in prose, look for the next object after it.
+                    # Objects nested in it are skipped, they are not the answer
+                    self._start = None
+                    self._in_string = self._escaped = False
+        return None
+
+    @staticmethod
+    def _is_object(text):
+        try:
+            return isinstance(json.loads(text), dict)
+        except json.JSONDecodeError:
+            return False
+
+# Python literals and typographic quotes that models put into otherwise valid JSON
+_REPLACEMENTS = {"“": '"', "”": '"', "‘": "'", "’": "'"}
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = re.compile(r"\b(True|False|None)\b")
+_UNQUOTED_KEY = re.compile(r"([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)(\s*:)")
+
+def _close_brackets(text):
+    """Append the closing brackets of a truncated object"""
+    stack = []
+    in_string = escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+def _cut_object(text):
+    """
+    The text up to the bracket that closes its first one, so prose after the object is
+    dropped. Single and double quoted strings are skipped. All of the text if it is truncated.
+    """
+    depth = 0
+    quote = None
+    escaped = False
+    for position, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[:position + 1]
+    return text
+
+def repair_json(text):
+    """
+    Best effort repair of a near-valid JSON object: surrounding prose or fences, trailing
+    commas, single or typographic quotes, unquoted keys, Python literals and missing
+    closing brackets. Returns the object as a JSON string, or None if it cannot be repaired.
+    """
+    if not isinstance(text, str):
+        return None
+    found = JSONObjectScanner().feed(text)
+    if found is not None:
+        return found
+    start = text.find("{")
+    while start >= 0:
+        repaired = _repair_object(text[start:])
+        if repaired is not None:
+            return repaired
+        start = text.find("{", start + 1)
+    return None
+
+def _repair_object(candidate):
+    for old, new in _REPLACEMENTS.items():
+        candidate = candidate.replace(old, new)
+    candidate = _close_brackets(_cut_object(candidate).strip().rstrip("`").strip())
+
+    fixed = _UNQUOTED_KEY.sub(r'\1"\2"\3', _TRAILING_COMMA.sub(r"\1", candidate))
+    fixed = _PYTHON_LITERALS.sub(lambda m: {"True": "true", "False": "false", "None": "null"}[m.group(1)], fixed)
+    # A Python dictionary is read as one before quotes are swapped, which would break
+    # escaped apostrophes in single quoted strings
+    attempts = [(json.loads, candidate), (json.loads, fixed), (ast.literal_eval, candidate),
+                (json.loads, fixed.replace("'", '"'))]
+    for parse, attempt in attempts:
+        try:
+            obj = parse(attempt)
+            if isinstance(obj, dict):
+                # Python literals such as sets are not JSON
+                return json.dumps(obj)
+        except (TypeError, ValueError, SyntaxError, MemoryError, RecursionError):
+            continue
+    return None
@@ -0,0 +1,511 @@
+import asyncio
+import httpx
+import ollama
+import json
+import os
+import threading
+import time
+from intent_parser import fast_parse
+from json_stream import JSONObjectScanner, repair_json
+from llm_cache import LLMCache
+from methods import batch_schema, request_schema, validate_request
+
+SUPPORTED_METHODS = """
+Supported methods:
+1. find_person
+2. insert_person
+3. add_task
+4. check_tasks (optional params: offset, limit, for one page of a long task list)
+5. status
+6. search_people (for partial or misspelled names, params: query)
+"""
+
+# Fixed instructions, sent as the system message of every call. They never change, so
+# Ollama reuses their evaluated prefix and only the user query is evaluated per call
+SYSTEM_PROMPT = """
+Strictly return one json only, no explanations.
+Unknown or unsupported methods should return an error message in json.
+The user message is the query.
+""" + SUPPORTED_METHODS + """
+Example output json:
+{
+    "method": "find_person",
+    "params": {
+        "name": "John Doe"
+    }
+}
+"""
+
+# System message of a batch, the user message is a json array of {"id", "query"}
+BATCH_SYSTEM_PROMPT = """
+Strictly return one json only, no explanations.
+The user message is a json array of queries, each with an id.
+Answer every query in the "results" array, with the id of its query.
+Unknown or unsupported methods should return an error message with the id.
+""" + SUPPORTED_METHODS + """
+Example user message:
+[{"id": 0, "query": "Who is John Doe?"}, {"id": 1, "query": "Check my tasks"}]
+
+Example output json:
+{
+    "results": [
+        {"id": 0, "method": "find_person", "params": {"name": "John Doe"}},
+        {"id": 1, "method": "check_tasks", "params": {}}
+    ]
+}
+"""
+
+# Persistent cache of Ollama responses, an empty LLM_CACHE_PATH disables it
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+# Cosine similarity needed to reuse the response of a different but similar query, 0 disables it
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0"))
+LLM_CACHE_EMBED_MODEL = os.getenv("LLM_CACHE_EMBED_MODEL", "nomic-embed-text")
+
+def embed_query(text):
+    return ollama.embed(model=LLM_CACHE_EMBED_MODEL, input=text)["embeddings"][0]
+
+# Only requests without params are reused for a similar query: the params of another
+# query ("Alice Smyth", "age 31") would silently look up or write the wrong data
+SIMILAR_QUERY_METHODS = {"status", "check_tasks"}
+
+def reusable_for_similar_query(response):
+    try:
+        request = json.loads(response)
+    except json.JSONDecodeError:
+        return False
+    return request.get("method") in SIMILAR_QUERY_METHODS and not request.get("params")
+
+llm_cache = LLMCache(
+    LLM_CACHE_PATH,
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+    embed_fn=embed_query if LLM_CACHE_SIMILARITY > 0 else None,
+    similarity_threshold=LLM_CACHE_SIMILARITY,
+    reusable_fn=reusable_for_similar_query
+) if LLM_CACHE_PATH else None
+
+# Sent as a follow-up user message after the previous answer, so the conversation so far,
+# system prompt and query included, is still a cached prefix
+REPROMPT = """
+Your previous answer was not a valid request: {error}
+
+Return the corrected json only.
+"""
+
+DEFAULT_MODEL = "llama3.2"
+# Stream the generation and stop it at the end of the first JSON object, 0 waits for the whole response
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+# Constrain the output to the JSON schema of the supported requests, see methods.request_schema
+LLM_SCHEMA = os.getenv("LLM_SCHEMA", "1") == "1"
+REQUEST_SCHEMA = request_schema()
+BATCH_SCHEMA = batch_schema()
+# Times an invalid answer is sent back to the model for correction
+LLM_REPROMPTS = int(os.getenv("LLM_REPROMPTS", "1"))
+# How long Ollama keeps the model loaded after a call, a duration ("30m") or seconds, negative keeps it loaded
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+# Load the model and evaluate the system prompt when the client starts instead of on the first query
+LLM_PRELOAD = os.getenv("LLM_PRELOAD", "1") == "1"
+# Queries answered by one Ollama call in BatchingParser, 1 sends every query on its own
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+# Seconds BatchingParser waits for more queries before sending an incomplete batch
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0.02"))
+
+def keep_alive_value(value):
+    """Ollama takes a number of seconds or a duration string, "-1" would not parse as a duration"""
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def check_response(response):
+    """
+    Repair a model answer that is nearly valid JSON and validate it against the methods.
+    Returns (response, error), error is None for a usable answer.
+    """
+    repaired = repair_json(response)
+    if repaired is None:
+        return response, "the answer is not a json object"
+    request = json.loads(repaired)
+    if "error" in request and "method" not in request:
+        # The model says it cannot answer, asking again will not change that
+        return repaired, None
+    try:
+        validate_request(request)
+    except ValueError as e:
+        return repaired, str(e)
+    return repaired, None
+
+def query_messages(query):
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": query}]
+
+def reprompt(messages, response, error):
+    return messages + [{"role": "assistant", "content": response},
+                       {"role": "user", "content": REPROMPT.format(error=error)}]
+
+class LLMClient:
+    """
+    Long-lived Ollama client of one model. The HTTP connection is reused between calls,
+    every call asks Ollama to keep the model loaded for keep_alive, and preload loads it
+    and evaluates the system prompt before the first query arrives.
+
+    Timings of every call are added up per phase: load (model loading), prompt (evaluating
+    the prompt tokens that were not cached) and generation. Ollama reports them at the end
+    of a response, a stream that is stopped early is timed here instead: prompt is the wait
+    for the first chunk, generation the rest.
+    """
+    def __init__(self, model=DEFAULT_MODEL, keep_alive=LLM_KEEP_ALIVE, host=None):
+        self.model = model
+        self.keep_alive = keep_alive_value(keep_alive)
+        self.host = host
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+        self._timings = {"calls": 0, "load_ms": 0.0, "prompt_ms": 0.0, "prompt_tokens": 0,
+                         "generation_ms": 0.0, "generated_tokens": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ollama.Client(host=self.host)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = ollama.AsyncClient(host=self.host)
+        return self._async_client
+
+    def _options(self, stream, schema):
+        options = {"model": self.model, "keep_alive": self.keep_alive, "stream": stream}
+        if LLM_SCHEMA:
+            options["format"] = schema
+        return options
+
+    def _preload_options(self, system):
+        # One generated token is enough to load the model and cache the system prompt
+        return {"model": self.model, "messages": [{"role": "system", "content": system}],
+                "keep_alive": self.keep_alive, "options": {"num_predict": 1}}
+
+    def preload(self, system=SYSTEM_PROMPT):
+        """Load the model and evaluate the system prompt, False if Ollama could not be reached"""
+        try:
+            self._record_final(self.client.chat(**self._preload_options(system)), count=False)
+        except (ollama.ResponseError, ConnectionError):
+            return False
+        return True
+
+    async def preload_async(self, system=SYSTEM_PROMPT):
+        try:
+            self._record_final(await self.async_client.chat(**self._preload_options(system)), count=False)
+        except (ollama.ResponseError, ConnectionError):
+            return False
+        return True
+
+    def chat(self, messages, schema=REQUEST_SCHEMA):
+        """
+        The answer to messages, with streaming only up to the end of the first JSON object.
+        Raises ConnectionError when Ollama cannot be reached or drops the connection.
+        """
+        try:
+            return self._chat(messages, schema)
+        except httpx.TransportError as e:
+            # The ollama client only converts connection errors outside of streaming
+            raise ConnectionError(f"Ollama is unreachable: {e}") from e
+
+    def _chat(self, messages, schema):
+        if not LLM_STREAM:
+            response = self.client.chat(messages=messages, **self._options(False, schema))
+            self._record_final(response)
+            return response['message']['content']
+
+        scanner = JSONObjectScanner()
+        timer = _StreamTimer()
+        stream = self.client.chat(messages=messages, **self._options(True, schema))
+        try:
+            for chunk in stream:
+                timer.chunk(chunk)
+                request = scanner.feed(chunk['message']['content'])
+                if request is not None:
+                    return request
+        finally:
+            # Closing the stream drops the connection, which makes Ollama stop generating
+            stream.close()
+            self._record_stream(timer)
+        return scanner.text
+
+    async def chat_async(self, messages, schema=REQUEST_SCHEMA):
+        """Same as chat, without blocking the event loop while Ollama generates"""
+        try:
+            return await self._chat_async(messages, schema)
+        except httpx.TransportError as e:
+            raise ConnectionError(f"Ollama is unreachable: {e}") from e
+
+    async def _chat_async(self, messages, schema):
+        if not LLM_STREAM:
+            response = await self.async_client.chat(messages=messages, **self._options(False, schema))
+            self._record_final(response)
+            return response['message']['content']
+
+        scanner = JSONObjectScanner()
+        timer = _StreamTimer()
+        stream = await self.async_client.chat(messages=messages, **self._options(True, schema))
+        try:
+            async for chunk in stream:
+                timer.chunk(chunk)
+                request = scanner.feed(chunk['message']['content'])
+                if request is not None:
+                    return request
+        finally:
+            await stream.aclose()
+            self._record_stream(timer)
+        return scanner.text
+
+    def _record_final(self, response, count=True):
+        """Add the timings Ollama reports in the last chunk of a response, durations are in ns"""
+        self._record(
+            count,
+            (response.get("load_duration") or 0) / 1e6,
+            (response.get("prompt_eval_duration") or 0) / 1e6,
+            response.get("prompt_eval_count") or 0,
+            (response.get("eval_duration") or 0) / 1e6,
+            response.get("eval_count") or 0
+        )
+
+    def _record_stream(self, timer):
+        if timer.final is not None:
+            self._record_final(timer.final)
+        elif timer.first is not None:
+            now = time.perf_counter()
+            self._record(True, 0.0, (timer.first - timer.started) * 1000, 0,
+                         (now - timer.first) * 1000, timer.chunks)
+
+    def _record(self, count, load_ms, prompt_ms, prompt_tokens, generation_ms, generated_tokens):
+        with self._lock:
+            timings = self._timings
+            timings["calls"] += count
+            timings["load_ms"] += load_ms
+            timings["prompt_ms"] += prompt_ms
+            timings["prompt_tokens"] += prompt_tokens
+            timings["generation_ms"] += generation_ms
+            timings["generated_tokens"] += generated_tokens
+
+    def stats(self):
+        """Total and per call timings of the calls so far, the preload counts towards load_ms only"""
+        with self._lock:
+            timings = dict(self._timings)
+        calls = timings["calls"]
+        timings["avg_prompt_ms"] = timings["prompt_ms"] / calls if calls else 0.0
+        timings["avg_generation_ms"] = timings["generation_ms"] / calls if calls else 0.0
+        return timings
+
+class _StreamTimer:
+    """Arrival times of the chunks of one streamed response"""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first = None
+        self.chunks = 0
+        self.final = None
+
+    def chunk(self, chunk):
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.chunks += 1
+        if chunk.get("done"):
+            self.final = chunk
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm_client(model=DEFAULT_MODEL):
+    """The shared LLMClient of a model, created on first use"""
+    with _clients_lock:
+        if model not in _clients:
+            _clients[model] = LLMClient(model)
+        return _clients[model]
+
+def llm_stats(model=DEFAULT_MODEL):
+    return get_llm_client(model).stats()
+
+def query_ollama(prompt, model=DEFAULT_MODEL):
+    """Answer a single user message without the system prompt"""
+    return get_llm_client(model).chat([{"role": "user", "content": prompt}])
+
+async def query_ollama_async(prompt, model=DEFAULT_MODEL):
+    return await get_llm_client(model).chat_async([{"role": "user", "content": prompt}])
+
+def parse_query(query, model=DEFAULT_MODEL):
+    """
+    Turn a natural language query into the request json string.
+    Structured queries are handled by the rule-based fast path, the rest goes to Ollama
+    unless the same query was answered before. Ollama's answer is repaired if it is nearly
+    valid, and sent back for correction once if it is not a valid request. Cached answers
+    are validated like fresh ones by send_request_to_server.
+    """
+    request = fast_parse(query)
+    if request is not None:
+        return json.dumps(request)
+
+    if llm_cache:
+        cached = llm_cache.get(model, query)
+        if cached is not None:
+            return cached
+
+    client = get_llm_client(model)
+    messages = query_messages(query)
+    response, error = check_response(client.chat(messages))
+    for _ in range(LLM_REPROMPTS if error else 0):
+        messages = reprompt(messages, response, error)
+        response, error = check_response(client.chat(messages))
+        if not error:
+            break
+    if llm_cache and not error and is_request_json(response):
+        llm_cache.put(model, query, response)
+    return response
+
+def is_request_json(response):
+    """Only responses that parse into a request are worth caching"""
+    try:
+        return "method" in json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        return False
+
+async def parse_query_async(query, model=DEFAULT_MODEL):
+    """
+    Same as parse_query, without blocking the event loop while Ollama generates. The cache
+    is used from a thread, with LLM_CACHE_SIMILARITY it embeds the query through Ollama.
+    """
+    request = fast_parse(query)
+    if request is not None:
+        return json.dumps(request)
+
+    if llm_cache:
+        cached = await asyncio.to_thread(llm_cache.get, model, query)
+        if cached is not None:
+            return cached
+
+    return await ask_ollama_async(query, model)
+
+async def ask_ollama_async(query, model=DEFAULT_MODEL):
+    """The LLM part of parse_query_async: ask, repair, re-prompt and cache a valid answer"""
+    client = get_llm_client(model)
+    messages = query_messages(query)
+    response, error = check_response(await client.chat_async(messages))
+    for _ in range(LLM_REPROMPTS if error else 0):
+        messages = reprompt(messages, response, error)
+        response, error = check_response(await client.chat_async(messages))
+        if not error:
+            break
+    if llm_cache and not error and is_request_json(response):
+        await asyncio.to_thread(llm_cache.put, model, query, response)
+    return response
+
+class BatchingParser:
+    """
+    parse_query_async that answers many queries with one Ollama call.
+
+    Queries that need the LLM are held for up to window seconds or until max_batch of them
+    are waiting, then sent together as a json array of {"id", "query"}, and the model
+    answers with {"results": [{"id", "method", "params"}, ...]}. The batch pays for the
+    instructions and the model call once instead of once per query. Each answer is
+    checked on its own: a query whose answer is missing or invalid is parsed alone with
+    parse_query_async's re-prompt, so one bad answer does not fail the others.
+    """
+    def __init__(self, model=DEFAULT_MODEL, max_batch=None, window=None):
+        self.model = model
+        self.max_batch = max_batch or LLM_BATCH_SIZE
+        self.window = LLM_BATCH_WINDOW if window is None else window
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._stats = {"batches": 0, "batched_queries": 0, "retried_alone": 0}
+
+    async def parse(self, query):
+        """Same contract as parse_query_async"""
+        request = fast_parse(query)
+        if request is not None:
+            return json.dumps(request)
+
+        if llm_cache:
+            cached = await asyncio.to_thread(llm_cache.get, self.model, query)
+            if cached is not None:
+                return cached
+
+        if self.max_batch <= 1:
+            return await ask_ollama_async(query, self.model)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Keep a reference, the event loop only holds weak references to tasks
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        answers = None
+        if len(batch) > 1:
+            try:
+                answers = await self._ask(query for query, _ in batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            self._stats["batches"] += 1
+            self._stats["batched_queries"] += len(batch)
+
+        await asyncio.gather(*(self._resolve(query, future, answers, index)
+                               for index, (query, future) in enumerate(batch)))
+
+    async def _ask(self, queries):
+        """Ask the model for all queries at once, return {id: answer json or None}"""
+        message = json.dumps([{"id": index, "query": query} for index, query in enumerate(queries)])
+        messages = [{"role": "system", "content": BATCH_SYSTEM_PROMPT}, {"role": "user", "content": message}]
+        response = repair_json(await get_llm_client(self.model).chat_async(messages, BATCH_SCHEMA))
+        results = json.loads(response).get("results") if response else None
+        answers = {}
+        for result in results if isinstance(results, list) else []:
+            if isinstance(result, dict) and isinstance(result.get("id"), int):
+                index = result.pop("id")
+                answers.setdefault(index, json.dumps(result))
+        return answers
+
+    async def _resolve(self, query, future, answers, index):
+        """Set the result of one query from the batch answers, None means it was alone"""
+        if future.done():
+            # The caller went away
+            return
+        try:
+            response = error = None
+            if answers is not None:
+                answer = answers.get(index)
+                response, error = check_response(answer) if answer is not None else (None, "no answer")
+                if error:
+                    self._stats["retried_alone"] += 1
+            if answers is None or error:
+                response = await ask_ollama_async(query, self.model)
+            elif llm_cache and is_request_json(response):
+                await asyncio.to_thread(llm_cache.put, self.model, query, response)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(response)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["avg_batch_size"] = stats["batched_queries"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
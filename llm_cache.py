@@ -0,0 +1,106 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+import time
+
+def normalize_query(query):
+    """Case, punctuation and whitespace insensitive form of a query, used as cache key"""
+    query = re.sub(r"[^\w\s]", " ", query.casefold())
+    return " ".join(query.split())
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM responses keyed on model name plus the normalized query,
+    so hits survive restarts. Entries expire after ttl seconds and the least recently
+    used ones are evicted beyond max_entries.
+    When embed_fn is given, a query that misses the exact key is also compared to the
+    cached queries of the same model and the closest one is used if its cosine
+    similarity reaches similarity_threshold. Only responses for which reusable_fn is true
+    are handed to a different query: similar queries can differ in exactly the values a
+    response carries, e.g. "age 30" and "age 31".
+    """
+    def __init__(self, path, max_entries=1000, ttl=86400.0, embed_fn=None, similarity_threshold=0.97,
+                 reusable_fn=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.reusable_fn = reusable_fn or (lambda response: True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                response TEXT NOT NULL,
+                embedding TEXT,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            )
+        """)
+
+    def get(self, model, query):
+        """Return the cached response for query, or None"""
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE model = ? AND query = ?", (model, key)
+            ).fetchone()
+        if row is None and self.embed_fn:
+            key, row = self._nearest(model, key)
+        if row is None:
+            return None
+        with self._lock:
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE model = ? AND query = ?", (now, model, key)
+            )
+        return row[0]
+
+    def put(self, model, query, response):
+        """Store a response and evict the least recently used entries above max_entries"""
+        key = normalize_query(query)
+        embedding = json.dumps(self.embed_fn(key)) if self.embed_fn else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (model, query, response, embedding, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (model, key, response, embedding, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM responses WHERE rowid IN ("
+                "SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def _nearest(self, model, key):
+        """Most similar cached query of the same model above the threshold, as (key, row)"""
+        embedding = self.embed_fn(key)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query, response, embedding FROM responses WHERE model = ? AND embedding IS NOT NULL",
+                (model,)
+            ).fetchall()
+        best_key, best_row, best_score = key, None, self.similarity_threshold
+        for query, response, stored in rows:
+            if not self.reusable_fn(response):
+                continue
+            score = cosine_similarity(embedding, json.loads(stored))
+            if score >= best_score:
+                best_key, best_row, best_score = query, (response,), score
+        return best_key, best_row
@@ -0,0 +1,160 @@
+import json
+
+# Methods each backend accepts and their required parameters, extra or noise params are dropped
+TODOIST_METHODS = {
+    "add_task": ["content", "description", "due_string"],
+    "check_tasks": [],
+    "task_status": ["local_id"],
+    "status": []
+}
+
+GOOGLE_SHEET_METHODS = {
+    "find_person": ["name"],
+    "search_people": ["query"],
+    "insert_person": ["name", "age", "occupation"],
+    "insert_people": ["people"],
+    "status": []
+}
+
+# Parameters a method also accepts, passed on when they are given
+OPTIONAL_PARAMS = {
+    "check_tasks": ["offset", "limit"]
+}
+
+PERSON_PARAMS = ["name", "age", "occupation"]
+
+# JSON schema of every parameter for the LLM's structured output, plain strings unless listed.
+# Missing details are null so the model does not have to invent them.
+PARAM_SCHEMAS = {
+    "age": {"type": ["integer", "null"]},
+    "occupation": {"type": ["string", "null"]},
+    "description": {"type": ["string", "null"]},
+    "due_string": {"type": ["string", "null"]},
+    "offset": {"type": ["integer", "null"]},
+    "limit": {"type": ["integer", "null"]}
+}
+
+SERVICES = {
+    "todoist": ("Todoist", TODOIST_METHODS),
+    "google_sheet": ("Google Sheet", GOOGLE_SHEET_METHODS)
+}
+
+def build_request(service, request):
+    """
+    Check a request json string against the methods of a service and return the clean
+    request dictionary that is sent to its server.
+    """
+    service_name, methods = SERVICES[service]
+
+    # Get request json
+    json_request = json.loads(request)
+    method = json_request.get("method")
+    params = json_request.get("params", {})
+
+    # Check method and params, ignore extra or noise params
+    if method not in methods:
+        raise ValueError(f"Unsupported method '{method}' for {service_name}.")
+
+    required = methods[method]
+    if method == "insert_people":
+        people = params.get("people")
+        if not isinstance(people, list) or not all(
+                isinstance(p, dict) and all(k in p for k in PERSON_PARAMS) for p in people):
+            raise ValueError("Missing required parameters for 'insert_people' method.")
+        params = {"people": [{k: p.get(k) for k in PERSON_PARAMS} for p in people]}
+    else:
+        if not all(k in params for k in required):
+            if len(required) == 1:
+                raise ValueError(f"Missing required parameter '{required[0]}' for '{method}' method.")
+            raise ValueError(f"Missing required parameters for '{method}' method.")
+        params = {**{k: params.get(k) for k in required},
+                  **{k: params[k] for k in OPTIONAL_PARAMS.get(method, []) if params.get(k) is not None}}
+
+    # Set request, service lets a gateway route methods that several services have
+    return {
+        "service": service,
+        "method": method,
+        "params": params
+    }
+
+def param_schema(param):
+    if param == "people":
+        person = {
+            "type": "object",
+            "properties": {k: PARAM_SCHEMAS.get(k, {"type": "string"}) for k in PERSON_PARAMS},
+            "required": PERSON_PARAMS
+        }
+        return {"type": "array", "items": person}
+    return PARAM_SCHEMAS.get(param, {"type": "string"})
+
+def request_schema():
+    """
+    JSON schema of the requests the services accept, built from the method tables above:
+    one alternative per method with its params, of which the optional ones are not required, plus {"error": ...} for queries
+    no method can answer. Used as Ollama's structured output format.
+    """
+    methods = {}
+    for _, service_methods in SERVICES.values():
+        for method, required in service_methods.items():
+            methods.setdefault(method, required)
+    alternatives = [{
+        "type": "object",
+        "properties": {
+            "method": {"const": method},
+            "params": {
+                "type": "object",
+                "properties": {param: param_schema(param) for param in required + OPTIONAL_PARAMS.get(method, [])},
+                "required": required
+            }
+        },
+        "required": ["method", "params"]
+    } for method, required in methods.items()]
+    alternatives.append({
+        "type": "object",
+        "properties": {"error": {"type": "string"}},
+        "required": ["error"]
+    })
+    return {"type": "object", "anyOf": alternatives}
+
+def batch_schema():
+    """
+    JSON schema of the answer to several queries at once: {"results": [...]} with one
+    request per query, tagged with the integer id of its query.
+    """
+    item = request_schema()
+    for alternative in item["anyOf"]:
+        alternative["properties"]["id"] = {"type": "integer"}
+        alternative["required"].append("id")
+    return {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": item}},
+        "required": ["results"]
+    }
+
+def validate_request(request):
+    """Raise ValueError with the reason if a request dictionary would not be accepted by its services"""
+    request_json = json.dumps(request)
+    for service in route_request(request_json):
+        build_request(service, request_json)
+
+def build_todoist_request(request):
+    return build_request("todoist", request)
+
+def build_google_sheet_request(request):
+    return build_request("google_sheet", request)
+
+def route_request(request):
+    """
+    Return the services a request json string has to be sent to.
+    status goes to every service, the other methods to the one service that has them.
+    """
+    try:
+        json_request = json.loads(request)
+    except json.JSONDecodeError:
+        raise ValueError("Invalid JSON format generated from ollama.")
+    method = json_request.get("method")
+
+    services = [service for service, (_, methods) in SERVICES.items() if method in methods]
+    if not services:
+        raise ValueError(f"Unsupported method '{method}' in the request.")
+    return services
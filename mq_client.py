@@ -0,0 +1,186 @@
+'''
+Reliable REQ clients for the ZeroMQ servers (the Lazy Pirate pattern).
+
+A REQ socket that sent a request and never got the reply cannot send again, so a
+request waits on poll() with a deadline for its method instead of a blocking recv.
+On timeout the socket is closed and a new one is connected; read only methods are
+then sent again, up to a bounded number of retries. Every backend has a circuit
+breaker: after a run of timeouts requests fail at once for a while, so a slow or
+dead backend does not pile up clients that are all waiting on it.
+'''
+
+import asyncio
+import os
+import threading
+import time
+import zmq
+import wire
+
+# Seconds a request may wait for its reply, by method
+DEFAULT_TIMEOUT = float(os.getenv("MQ_REQUEST_TIMEOUT", "10"))
+METHOD_TIMEOUTS = {
+    "status": 2.0,
+    "task_status": 2.0,
+    "find_person": 5.0,
+    "check_tasks": 10.0,
+    "add_task": 10.0,
+    "insert_person": 10.0,
+    "insert_people": 30.0
+}
+# Retries after a timeout, only for methods that are safe to send twice
+RETRIES = int(os.getenv("MQ_REQUEST_RETRIES", "2"))
+RETRY_SAFE_METHODS = {"status", "task_status", "find_person", "check_tasks"}
+# Timeouts in a row that open a circuit, and seconds it stays open
+BREAKER_FAILURES = int(os.getenv("MQ_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("MQ_BREAKER_RESET", "30"))
+
+class CircuitOpenError(ConnectionError):
+    """Raised without contacting the backend while its circuit is open"""
+
+def timeout_for(method):
+    return METHOD_TIMEOUTS.get(method, DEFAULT_TIMEOUT)
+
+def attempts_for(method):
+    return 1 + (RETRIES if method in RETRY_SAFE_METHODS else 0)
+
+class CircuitBreaker:
+    """
+    Closed: requests pass. After `failures` failed requests in a row it opens and
+    requests are refused for `reset_timeout` seconds, then one trial request is let
+    through (half open); its outcome closes the circuit or opens it again. A trial
+    that never reports back is replaced by a new one after another reset_timeout.
+    """
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._failed = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def allow(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            retry_in = self.reset_timeout - (now - self._opened_at)
+            if retry_in <= 0:
+                # Let this request through as the trial, the others wait for its outcome
+                self._opened_at = now
+                return
+        raise CircuitOpenError(f"{self.name} server is unavailable, retry in {retry_in:.0f}s.")
+
+    def record_success(self):
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failed += 1
+            if self._opened_at is not None or self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+
+class LazyPirateClient:
+    """REQ client for one backend with per-method deadlines, retries and a circuit breaker"""
+    def __init__(self, context, endpoint, name):
+        self.context = context
+        self.endpoint = endpoint
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self._socket = None
+        # A REQ socket carries one request at a time
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._socket = self.context.socket(zmq.REQ)
+        self._socket.connect(self.endpoint)
+
+    def _reset(self):
+        if self._socket is not None:
+            self._socket.close(linger=0)
+            self._socket = None
+
+    def request(self, request, timeout=None):
+        """Send a request dictionary and return the response dictionary"""
+        method = request.get("method")
+        timeout = timeout or timeout_for(method)
+        self.breaker.allow()
+        with self._lock:
+            for _ in range(attempts_for(method)):
+                if self._socket is None:
+                    self._connect()
+                try:
+                    self._socket.send_multipart(wire.encode_request(request))
+                    if self._socket.poll(timeout * 1000):
+                        response = wire.decode_reply(self._socket.recv_multipart())
+                        self.breaker.record_success()
+                        return response
+                except zmq.ZMQError:
+                    pass
+                # No reply in time, the socket cannot be used again
+                self._reset()
+        self.breaker.record_failure()
+        raise TimeoutError(f"{self.name} server did not answer '{method}' within {timeout:g}s.")
+
+    def close(self):
+        with self._lock:
+            self._reset()
+
+class AsyncLazyPirateClient:
+    """
+    asyncio version of LazyPirateClient. Every request in flight borrows its own REQ
+    socket, up to `size` idle sockets are kept for reuse.
+    """
+    def __init__(self, context, endpoint, name, size):
+        self.context = context
+        self.endpoint = endpoint
+        self.name = name
+        self.size = size
+        self.breaker = CircuitBreaker(name)
+        self._idle = []
+
+    def _connect(self):
+        socket = self.context.socket(zmq.REQ)
+        socket.connect(self.endpoint)
+        return socket
+
+    async def request(self, request, timeout=None):
+        method = request.get("method")
+        timeout = timeout or timeout_for(method)
+        self.breaker.allow()
+        for _ in range(attempts_for(method)):
+            socket = self._idle.pop() if self._idle else self._connect()
+            try:
+                await socket.send_multipart(wire.encode_request(request))
+                frames = await asyncio.wait_for(socket.recv_multipart(), timeout)
+            except (asyncio.TimeoutError, zmq.ZMQError):
+                socket.close(linger=0)
+                continue
+            except BaseException:
+                # A REQ socket that did not get its reply cannot send again
+                socket.close(linger=0)
+                raise
+            if len(self._idle) < self.size:
+                self._idle.append(socket)
+            else:
+                socket.close(linger=0)
+            self.breaker.record_success()
+            return wire.decode_reply(frames)
+        self.breaker.record_failure()
+        raise TimeoutError(f"{self.name} server did not answer '{method}' within {timeout:g}s.")
+
+    def close(self):
+        for socket in self._idle:
+            socket.close(linger=0)
+        self._idle = []
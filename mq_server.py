@@ -0,0 +1,289 @@
+import zmq
+import json
+import logging
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+import wire
+from singleflight import SingleFlight
+from metrics import Counter, Gauge, Histogram, start_metrics_server, take_upstream_seconds
+
+# Fraction of successful requests that are logged, failed requests are always logged
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+REQUESTS = Counter("mq_requests_total", "Requests handled, by method and outcome.", ["server", "method", "outcome"])
+REQUEST_SECONDS = Histogram("mq_request_duration_seconds",
+                            "Time from the broker receiving a request to the reply, queue wait included.",
+                            ["server", "method"])
+UPSTREAM_REQUEST_SECONDS = Histogram("mq_request_upstream_seconds",
+                                     "Time a request spent in upstream API calls.", ["server", "method"])
+QUEUE_WAIT_SECONDS = Histogram("mq_queue_wait_seconds", "Time a request waited for a free worker.", ["server"])
+QUEUE_DEPTH = Gauge("mq_queue_depth", "Requests received by the broker and not yet picked up by a worker.", ["server"])
+IN_FLIGHT = Gauge("mq_requests_in_flight", "Requests being handled by a worker.", ["server"])
+WORKERS = Gauge("mq_workers", "Worker threads of the server.", ["server"])
+COALESCED = Counter("mq_coalesced_requests_total", "Read requests answered with the result of an identical request.",
+                    ["server", "method"])
+
+# Identical read requests in flight share one upstream call, their result can be kept for a TTL in seconds
+SINGLE_FLIGHT = os.getenv("MQ_SINGLE_FLIGHT", "1") == "1"
+SINGLE_FLIGHT_TTL = float(os.getenv("MQ_SINGLE_FLIGHT_TTL", "0"))
+
+# Seconds between the READY messages a broker sends to the gateway
+HEARTBEAT_INTERVAL = float(os.getenv("GATEWAY_HEARTBEAT", "1"))
+FRONTEND = b"F"
+GATEWAY = b"G"
+
+logger = logging.getLogger("mq_server")
+_logging_lock = threading.Lock()
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the fields passed as extra={"fields": {...}}"""
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry)
+
+def setup_logging():
+    """
+    Route the server log through a queue so worker threads never wait on stdout,
+    a listener thread does the formatting and writing.
+    """
+    # Several servers can start in one process, e.g. in benchmark.py
+    with _logging_lock:
+        if logger.handlers:
+            return
+        queue = SimpleQueue()
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JSONFormatter())
+        QueueListener(queue, stream).start()
+        logger.addHandler(QueueHandler(queue))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+def dispatch(api_functions, request):
+    """Dispatch one request dictionary to api_functions and return (method, response dictionary)"""
+    method = None
+    try:
+        method = request.get("method")
+        params = request.get("params", {})
+
+        # Process request
+        if method in api_functions:
+            try:
+                result = api_functions[method](**params)
+                response = {
+                    "success": True,
+                    "result": result
+                }
+            except Exception as e:
+                response = {
+                    "success": False,
+                    "error": str(e)
+                }
+        else:
+            response = {
+                "success": False,
+                "error": f"Method '{method}' not found"
+            }
+    except Exception as e:
+        # Handle unexpected errors during request processing
+        response = {
+            "success": False,
+            "error": f"Server error: {str(e)}"
+        }
+    return method, response
+
+def single_flight(api_functions, read_methods, name, ttl=0.0, write_methods=()):
+    """
+    Return api_functions with the read methods coalesced: a call with the same method and
+    params as one in flight waits for it and gets its result. The write methods drop the
+    results kept for the TTL, and reads in flight when they finish keep none either.
+    Other methods, e.g. status, are left alone.
+    """
+    flight = SingleFlight(ttl)
+
+    def read(method, function):
+        def call(**params):
+            key = (method, json.dumps(params, sort_keys=True, default=str))
+            result, shared = flight.do(key, lambda: function(**params))
+            if shared:
+                COALESCED.inc(server=name, method=method)
+            return result
+        return call
+
+    def write(function):
+        def call(**params):
+            try:
+                return function(**params)
+            finally:
+                flight.forget()
+        return call
+
+    wrapped = {}
+    for method, function in api_functions.items():
+        if method in read_methods:
+            wrapped[method] = read(method, function)
+        elif method in write_methods:
+            wrapped[method] = write(function)
+        else:
+            wrapped[method] = function
+    return wrapped
+
+def worker(context, backend_url, api_functions, name):
+    """
+    Worker thread, answers requests handed out by the broker's DEALER socket.
+    Each request arrives as [receive time, source, client envelope..., b"", body...], the reply
+    goes back as [source, client envelope..., b"", reply...] so the broker can route it to the client.
+    The body and reply frames follow the wire module.
+    """
+    socket = context.socket(zmq.DEALER)
+    socket.connect(backend_url)
+    try:
+        while True:
+            frames = socket.recv_multipart()
+            started = time.perf_counter()
+            QUEUE_DEPTH.dec(server=name)
+            try:
+                received_at = struct.unpack("d", frames[0])[0]
+                delimiter = frames.index(b"", 1)
+            except (struct.error, ValueError):
+                # Not a REQ style request, there is nobody to answer
+                continue
+            envelope, body = frames[1:delimiter + 1], frames[delimiter + 1:]
+
+            IN_FLIGHT.inc(server=name)
+            QUEUE_WAIT_SECONDS.observe(started - received_at, server=name)
+            take_upstream_seconds()
+            codec = None
+            try:
+                codec, request = wire.decode_request(body)
+            except Exception as e:
+                method, response = None, {"success": False, "error": f"Server error: {str(e)}"}
+            else:
+                method, response = dispatch(api_functions, request)
+            upstream_seconds = take_upstream_seconds()
+            send_reply(socket, envelope, codec, response)
+            IN_FLIGHT.dec(server=name)
+
+            total_seconds = time.perf_counter() - received_at
+            label = method if method in api_functions else "unknown"
+            outcome = "success" if response["success"] else "error"
+            REQUESTS.inc(server=name, method=label, outcome=outcome)
+            REQUEST_SECONDS.observe(total_seconds, server=name, method=label)
+            UPSTREAM_REQUEST_SECONDS.observe(upstream_seconds, server=name, method=label)
+            if not response["success"] or random.random() < LOG_SAMPLE_RATE:
+                logger.info("request", extra={"fields": {
+                    "server": name,
+                    "method": method,
+                    "outcome": outcome,
+                    "error": response.get("error"),
+                    "total_ms": round(total_seconds * 1000, 2),
+                    "upstream_ms": round(upstream_seconds * 1000, 2),
+                    "queue_ms": round((started - received_at) * 1000, 2)
+                }})
+    except zmq.ContextTerminated:
+        pass
+    finally:
+        socket.close(linger=0)
+
+def send_reply(socket, envelope, codec, response):
+    """Send a response to the client behind envelope"""
+    try:
+        reply = wire.encode_reply(codec, response)
+    except Exception as e:
+        # E.g. a result the codec cannot serialize, the client still gets an answer
+        reply = wire.encode_reply(codec, {"success": False, "error": f"Server error: {str(e)}"})
+    socket.send_multipart(envelope + reply)
+
+def serve(api_functions, port, name, workers=1, metrics_port=None, service=None, read_methods=(),
+          write_methods=()):
+    """
+    Run a ROUTER/DEALER broker on the given port with a pool of worker threads.
+    REQ clients connect to the ROUTER frontend exactly as they would to a REP socket,
+    the DEALER backend fair-queues their requests over the workers so up to
+    `workers` upstream API calls can be in progress at the same time.
+    Metrics are served on http://<host>:<metrics_port>/metrics unless metrics_port is falsy.
+    When GATEWAY_BACKEND_URL is set the broker also registers its methods with the
+    gateway under `service` and takes requests routed by it, see gateway.py.
+    Identical concurrent calls of read_methods share one call, and write_methods make
+    them start over, see single_flight.
+    """
+    setup_logging()
+    workers = max(1, workers)
+    if SINGLE_FLIGHT and read_methods:
+        api_functions = single_flight(api_functions, read_methods, name, SINGLE_FLIGHT_TTL, write_methods)
+    context = zmq.Context()
+    frontend = context.socket(zmq.ROUTER)
+    frontend.bind(f"tcp://*:{port}")
+    backend_url = f"inproc://{name.lower().replace(' ', '-')}-workers"
+    backend = context.socket(zmq.DEALER)
+    backend.bind(backend_url)
+
+    for i in range(workers):
+        thread = threading.Thread(target=worker, args=(context, backend_url, api_functions, name),
+                                  name=f"{name} worker {i}", daemon=True)
+        thread.start()
+    WORKERS.set(workers, server=name)
+
+    if metrics_port:
+        start_metrics_server(metrics_port)
+        print(f"{name} metrics on http://localhost:{metrics_port}/metrics")
+
+    # Requests are tagged with the socket they came from so the reply goes back the same way
+    sources = {FRONTEND: frontend}
+    poller = zmq.Poller()
+    poller.register(frontend, zmq.POLLIN)
+    poller.register(backend, zmq.POLLIN)
+    gateway = None
+    gateway_url = os.getenv("GATEWAY_BACKEND_URL")
+    if gateway_url:
+        gateway = context.socket(zmq.DEALER)
+        gateway.connect(gateway_url)
+        sources[GATEWAY] = gateway
+        poller.register(gateway, zmq.POLLIN)
+        # The gateway sends every write of a service to one instance, see gateway.Registry.pick
+        ready = [b"", b"READY", (service or name).encode(), json.dumps(sorted(api_functions)).encode(),
+                 json.dumps(sorted(write_methods)).encode()]
+        next_heartbeat = 0
+        print(f"{name} registering with the gateway at {gateway_url}")
+
+    print(f"{name} Server started. Listening on port {port} with {workers} workers...")
+
+    try:
+        while True:
+            if gateway:
+                # READY doubles as the heartbeat, a restarted gateway relearns us from it
+                now = time.monotonic()
+                if now >= next_heartbeat:
+                    gateway.send_multipart(ready)
+                    next_heartbeat = now + HEARTBEAT_INTERVAL
+                events = dict(poller.poll(max(0, next_heartbeat - now) * 1000))
+            else:
+                events = dict(poller.poll())
+            for source, socket in sources.items():
+                if events.get(socket) == zmq.POLLIN:
+                    frames = socket.recv_multipart()
+                    # Stamp the arrival time so workers can measure queue wait and total latency
+                    QUEUE_DEPTH.inc(server=name)
+                    backend.send_multipart([struct.pack("d", time.perf_counter()), source] + frames)
+            if events.get(backend) == zmq.POLLIN:
+                source, *reply = backend.recv_multipart()
+                sources[source].send_multipart(reply)
+    except KeyboardInterrupt:
+        print(f"\nShutting down {name} server...")
+    finally:
+        # Ensure the sockets and context are closed on exit, this also stops the workers
+        for socket in sources.values():
+            socket.close(linger=0)
+        backend.close(linger=0)
+        context.term()
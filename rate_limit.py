@@ -0,0 +1,137 @@
+'''
+Client side rate limiting of the upstream APIs.
+
+Every upstream API (Google Sheets, Todoist) gets one token bucket per process, shared by
+all worker threads, that refills at {API}_RATE_PER_MINUTE requests per minute with
+bursts of up to {API}_BURST. Callers that find the bucket empty queue for a token and
+reads are served before writes. A 429 response pauses the whole bucket for its
+Retry-After (or an exponential backoff) and the call is retried, so a burst settles
+just under the quota instead of turning into a run of errors.
+'''
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from metrics import Counter, Histogram
+
+QUOTA_WAIT_SECONDS = Histogram("upstream_quota_wait_seconds", "Time a call waited for the rate limiter.", ["api", "kind"])
+RATE_LIMITED = Counter("upstream_rate_limited_total", "Upstream calls answered with 429 Too Many Requests.", ["api"])
+
+READ = 0
+WRITE = 1
+
+class QuotaExceededError(RuntimeError):
+    """The upstream API kept answering 429 after every retry"""
+
+def retry_after(error):
+    """
+    For a 429 error of googleapiclient (HttpError.resp) or requests (HTTPError.response)
+    return the seconds to wait from its Retry-After header, 0 if it has none.
+    None if error is not a 429.
+    """
+    response = getattr(error, "resp", None)
+    if response is None:
+        response = getattr(error, "response", None)
+    status = getattr(response, "status", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    # httplib2 responses are dictionaries with lowercase keys, requests has headers
+    headers = getattr(response, "headers", response)
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+class RateLimiter:
+    """Token bucket with a priority queue of waiters, rate 0 lets every call through at once"""
+    def __init__(self, api, rate_per_minute, burst, max_retries=4, backoff=1.0, max_backoff=32.0):
+        self.api = api
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority=WRITE):
+        """Block until the call may go out, reads (READ) are let through before writes (WRITE)"""
+        start = time.monotonic()
+        with self._condition:
+            entry = (priority, next(self._order))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._paused_until - now
+                    if wait <= 0 and self._waiters[0] == entry:
+                        if not self.rate:
+                            break
+                        if self._tokens >= 1:
+                            self._tokens -= 1
+                            break
+                        wait = (1 - self._tokens) / self.rate
+                    self._condition.wait(wait if wait > 0 else None)
+            finally:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                # The next waiter in line may be able to go now
+                self._condition.notify_all()
+        QUOTA_WAIT_SECONDS.observe(time.monotonic() - start, api=self.api, kind="read" if priority == READ else "write")
+
+    def pause(self, seconds):
+        """Hold back every call for seconds, after a 429"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # The quota is used up, do not burst again right after the pause
+            self._tokens = min(self._tokens, 0.0)
+            self._condition.notify_all()
+
+    def call(self, fn, write=False):
+        """Run fn() once a token is available, retrying it after 429 responses"""
+        for attempt in itertools.count():
+            self.acquire(WRITE if write else READ)
+            try:
+                return fn()
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None:
+                    raise
+                RATE_LIMITED.inc(api=self.api)
+                if attempt >= self.max_retries:
+                    raise QuotaExceededError(f"{self.api} quota exceeded, try again later.") from e
+                self.pause(max(delay, min(self.backoff * 2 ** attempt, self.max_backoff)))
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(api):
+    """
+    The rate limiter of an upstream API, created on first use from {API}_RATE_PER_MINUTE
+    and {API}_BURST, e.g. SHEETS_RATE_PER_MINUTE.
+    """
+    with _limiters_lock:
+        if api not in _limiters:
+            prefix = api.upper()
+            _limiters[api] = RateLimiter(api, float(os.getenv(f"{prefix}_RATE_PER_MINUTE", "60")),
+                                         int(os.getenv(f"{prefix}_BURST", "10")))
+        return _limiters[api]
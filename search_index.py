@@ -0,0 +1,191 @@
+'''
+Fuzzy name search over an n-gram index.
+
+Every name is split into the trigrams of " name ", and each trigram points to the names
+that contain it. A query ranks names by the Dice similarity of their trigrams, so
+misspelled names ("Alise Smith") are still found. Names that start with the query, or
+have a word that does, rank above mere look-alikes, so partial names ("Alice") find
+"Alice Smith".
+
+Common trigrams point to a large part of the sheet, so a query does not count them all.
+The word starts of the names are kept in sorted lists, one per name length, so the
+shortest partial names, which score the highest, are found by bisection. The best
+results so far set the score a look-alike needs to make the list, and a name only
+reaches it if it shares enough trigrams with the query and has a close enough number
+of its own. The postings are scored rarest first, only for names of a fitting size,
+until the names left could not get in any more.
+'''
+
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+# Larger changes rebuild the sorted word starts at once instead of one insort per name
+RESORT_FRACTION = 0.01
+
+def trigrams(text):
+    """Set of the trigrams of a lowercased text, padded so short words and word starts count"""
+    padded = f"  {' '.join(text.lower().split())} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def word_starts(key):
+    """The name from each of its words on, "alice smith" gives "alice smith" and "smith\""""
+    return {key} | {key[match.start():] for match in re.finditer(r"(?<= )\S", key)}
+
+def is_partial(query, key):
+    """True if the name starts with the query or has a word that does"""
+    return key.startswith(query) or f" {query}" in key
+
+def prefix_score(query, key):
+    """Score of a partial name, above look-alikes but below the exact name"""
+    return 0.8 + 0.19 * len(query) / len(key)
+
+class NameSearchIndex:
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._grams = {}
+        # Names by their number of trigrams
+        self._sizes = defaultdict(set)
+        # Name length: sorted (word start, name) pairs, see word_starts
+        self._starts = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, name):
+        with self._lock:
+            key = name.lower()
+            if self._add(key):
+                self._list(key)
+
+    def remove(self, name):
+        with self._lock:
+            key = name.lower()
+            if self._remove(key):
+                self._unlist(key)
+
+    def _add(self, key):
+        """Index the trigrams of key, False if it was already there"""
+        if key in self._grams:
+            return False
+        grams = trigrams(key)
+        self._grams[key] = len(grams)
+        self._sizes[len(grams)].add(key)
+        for gram in grams:
+            self._postings[gram].add(key)
+        return True
+
+    def _remove(self, key):
+        """Drop the trigrams of key, False if it was not there"""
+        size = self._grams.pop(key, None)
+        if size is None:
+            return False
+        self._sizes[size].discard(key)
+        if not self._sizes[size]:
+            del self._sizes[size]
+        for gram in trigrams(key):
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+        return True
+
+    def _list(self, key):
+        for start in word_starts(key):
+            insort(self._starts[len(key)], (start, key))
+
+    def _unlist(self, key):
+        starts = self._starts[len(key)]
+        for start in word_starts(key):
+            i = bisect_left(starts, (start, key))
+            if i < len(starts) and starts[i] == (start, key):
+                del starts[i]
+        if not starts:
+            del self._starts[len(key)]
+
+    def sync(self, names):
+        """Make the index hold exactly names, touching only the ones that were added or removed"""
+        keys = {name.lower() for name in names}
+        with self._lock:
+            removed = set(self._grams) - keys
+            added = keys - set(self._grams)
+            for key in removed:
+                self._remove(key)
+            for key in added:
+                self._add(key)
+            if len(removed) + len(added) > RESORT_FRACTION * len(self._grams):
+                self._starts = defaultdict(list)
+                for key in self._grams:
+                    self._starts[len(key)].extend((start, key) for start in word_starts(key))
+                for starts in self._starts.values():
+                    starts.sort()
+            else:
+                for key in removed:
+                    self._unlist(key)
+                for key in added:
+                    self._list(key)
+
+    def search(self, query, limit=5, min_score=0.3):
+        """Return up to limit (lowercased name, score) pairs, best first, score between 0 and 1"""
+        query = " ".join(query.lower().split())
+        if not query or limit <= 0:
+            return []
+        grams = trigrams(query)
+        with self._lock:
+            scores = {}
+            for length in sorted(self._starts):
+                if len(scores) >= limit:
+                    break
+                # Every word start that begins with the query sorts from the query on
+                starts = self._starts[length]
+                i = bisect_left(starts, (query,))
+                while i < len(starts) and len(scores) < limit and starts[i][0].startswith(query):
+                    key = starts[i][1]
+                    scores[key] = 1.0 if key == query else prefix_score(query, key)
+                    i += 1
+
+            postings = sorted((self._postings[gram] for gram in grams if gram in self._postings), key=len)
+            scored = set()
+            for rank, keys in enumerate(postings):
+                threshold = min_score
+                if len(scores) >= limit:
+                    threshold = max(threshold, heapq.nlargest(limit, scores.values())[-1])
+                # A name missing from all the postings up to here shares fewer trigrams than
+                # 2 * shared / (len(grams) + size) >= threshold needs, with shared <= size
+                needed = max(1, math.ceil(threshold * len(grams) / (2 - threshold) - 1e-9))
+                if rank > len(postings) - needed:
+                    break
+                candidates = self._fitting(keys - scored, len(grams), threshold)
+                shared = Counter()
+                for other in postings:
+                    shared.update(other.intersection(candidates))
+                for key, count in shared.items():
+                    score = 2 * count / (len(grams) + self._grams[key])
+                    if key == query:
+                        score = 1.0
+                    elif is_partial(query, key):
+                        score = max(score, prefix_score(query, key))
+                    if score >= threshold:
+                        scores[key] = max(score, scores.get(key, 0.0))
+                scored |= keys
+
+        results = [(key, score) for key, score in scores.items() if score >= min_score]
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
+
+    def _fitting(self, keys, count, threshold):
+        """The keys whose trigram count lets them reach threshold against a query of count trigrams"""
+        if threshold <= 0:
+            return keys
+        # With shared <= min(count, size), the Dice score bounds the size from both sides
+        low = count * threshold / (2 - threshold) - 1e-9
+        high = count * (2 - threshold) / threshold + 1e-9
+        sizes = [size for size in self._sizes if low <= size <= high]
+        if len(sizes) == len(self._sizes) or sum(len(self._sizes[size]) for size in sizes) >= len(keys):
+            return keys
+        return keys.intersection(set().union(*(self._sizes[size] for size in sizes)))
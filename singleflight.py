@@ -0,0 +1,71 @@
+'''
+Single-flight call coalescing.
+
+Identical calls that arrive while one is already running wait for it and share its
+result (or exception) instead of starting their own upstream call. With a ttl the result
+is also handed to identical calls for that many seconds after it finished.
+'''
+
+import threading
+import time
+from concurrent.futures import Future
+
+class SingleFlight:
+    def __init__(self, ttl=0.0):
+        self.ttl = ttl
+        self._calls = {}
+        self._results = {}
+        # Bumped by forget, a call that started before a forget must not keep its result
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Return (fn(), shared), running fn only if no call with the same key is in flight.
+        shared is True when the result came from another caller.
+        """
+        with self._lock:
+            if self.ttl:
+                cached = self._results.get(key)
+                if cached and cached[1] > time.monotonic():
+                    return cached[0], True
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                generation = self._generation
+
+        if not leader:
+            return call.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            if self.ttl:
+                with self._lock:
+                    if generation != self._generation:
+                        # A write finished while fn ran, its result may already be stale
+                        return result, False
+                    now = time.monotonic()
+                    for expired in [k for k, (_, expires) in self._results.items() if expires <= now]:
+                        del self._results[expired]
+                    self._results[key] = (result, now + self.ttl)
+            return result, False
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    def forget(self):
+        """
+        Drop the kept results, e.g. after a write changed what they would return.
+        Calls still running keep no result either, and later calls do not join them.
+        """
+        with self._lock:
+            self._results.clear()
+            self._calls.clear()
+            self._generation += 1
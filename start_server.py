@@ -1,36 +1,253 @@
-def start_zeromq_server():
-    import subprocess
-    import time
-    
-    servers_to_start = [
-        'todoist_mq.py',
-        'google_sheet_mq.py'
-    ]
-    
-    processes = []
-    for server_script in servers_to_start:
-        process = subprocess.Popen(['python', server_script])
-        print(f"Started {server_script} server...")
-        processes.append(process)
-    
-    # Give servers some time to start
-    time.sleep(5)
-    
-    return processes
-
-def stop_zeromq_server(process):
-    process.terminate()
-    process.wait()
-    print(f"Stopped server with PID: {process.pid}")
+'''
+Process supervisor for the ZeroMQ servers and the HTTP ingress.
 
-if __name__ == "__main__":
-    running_processes = start_zeromq_server()
-    
+Starts todoist_mq and google_sheet_mq (and the gateway when replicas are used) and the
+ingress, unless --no-ingress or START_INGRESS=0, waits until each server answers its
+status method and the ingress its /health endpoint, restarts any that exit with an exponential
+backoff, and stops them all on SIGINT/SIGTERM. Between events it sleeps in select() on
+the signal wakeup fd, which SIGCHLD, SIGINT and SIGTERM wake up, so it uses no CPU while
+all is well. Without SIGCHLD (Windows) it also wakes up every EXIT_POLL_INTERVAL seconds
+to look for servers that exited.
+
+With --replicas N (or SERVER_REPLICAS) every server runs N times: replica i listens on
+its base port + 10 * i and registers with a gateway started on GATEWAY_PORT, so clients
+reach all replicas through GATEWAY_ENDPOINT, which the ingress is given.
+
+Usage:
+    python start_server.py --replicas 2
+'''
+
+import argparse
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+import zmq
+
+import wire
+
+# Port distance between the replicas of one server
+REPLICA_PORT_STEP = 10
+# Seconds between readiness probes, and how long a probe waits for the status reply
+PROBE_INTERVAL = 0.5
+PROBE_TIMEOUT = 1.0
+# A server that is not ready after this long is reported, probing goes on
+# (the first Google login waits for the browser)
+READY_WARNING = 60
+# Restart delay doubles per crash up to the maximum, a server that ran this long is stable again
+RESTART_BACKOFF = 1.0
+RESTART_BACKOFF_MAX = 60.0
+STABLE_AFTER = 60.0
+STOP_TIMEOUT = 10.0
+
+# Without SIGCHLD exited servers are found by polling
+EXIT_POLL_INTERVAL = 1.0
+
+class Child:
+    """One supervised server process, http is True if it is probed over HTTP instead of ZeroMQ"""
+    def __init__(self, name, script, port=None, env=None, http=False):
+        self.name = name
+        self.script = script
+        self.port = port
+        self.env = env or {}
+        self.http = http
+        self.process = None
+        self.started_at = None
+        self.ready = False
+        self.warned = False
+        self.crashes = 0
+        self.restart_at = None
+
+    def start(self):
+        env = {**os.environ, **self.env}
+        self.process = subprocess.Popen([sys.executable, self.script], env=env)
+        self.started_at = time.monotonic()
+        self.ready = self.warned = False
+        self.restart_at = None
+        print(f"Started {self.name} (PID {self.process.pid})...")
+
+    def exited(self):
+        return self.process is not None and self.process.poll() is not None
+
+def probe(context, port):
+    """True if the server on port answers a status request"""
+    socket = context.socket(zmq.REQ)
+    socket.connect(f"tcp://localhost:{port}")
     try:
-        while True:
+        socket.send_multipart(wire.encode_request({"method": "status", "params": {}}))
+        # Any reply will do, the gateway answers status with an error until servers register
+        return socket.poll(PROBE_TIMEOUT * 1000) != 0
+    finally:
+        socket.close(linger=0)
+
+def probe_http(port):
+    """True if the HTTP server on port answers GET /health"""
+    try:
+        with socket.create_connection(("localhost", port), timeout=PROBE_TIMEOUT) as connection:
+            connection.sendall(b"GET /health HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+            return connection.recv(64).startswith(b"HTTP/1.1 200")
+    except OSError:
+        return False
+
+def build_children(replicas, ingress=True):
+    todoist_port = int(os.getenv("TODOIST_MQ_PORT", "6001"))
+    google_sheet_port = int(os.getenv("GOOGLE_SHEET_MQ_PORT", "6002"))
+    todoist_metrics = int(os.getenv("TODOIST_METRICS_PORT", "8081"))
+    google_sheet_metrics = int(os.getenv("GOOGLE_SHEET_METRICS_PORT", "8082"))
+
+    children = []
+    gateway_env = {}
+    ingress_env = {}
+    if replicas > 1:
+        gateway_port = int(os.getenv("GATEWAY_PORT", "6000"))
+        backend_port = int(os.getenv("GATEWAY_BACKEND_PORT", "6100"))
+        children.append(Child("gateway", "gateway.py", gateway_port))
+        gateway_env["GATEWAY_BACKEND_URL"] = os.getenv("GATEWAY_BACKEND_URL") or f"tcp://localhost:{backend_port}"
+        ingress_env["GATEWAY_ENDPOINT"] = os.getenv("GATEWAY_ENDPOINT") or f"tcp://localhost:{gateway_port}"
+
+    # A write-behind queue lives in one process: task_status only knows the local_ids of
+    # its own queue, and a shared queue file would be delivered by every replica
+    todoist_replicas = replicas
+    if replicas > 1 and os.getenv("TODOIST_WRITE_BEHIND", "0") == "1":
+        print("TODOIST_WRITE_BEHIND=1 keeps the task queue in one process, running a single todoist_mq.")
+        todoist_replicas = 1
+
+    for i in range(replicas):
+        offset = REPLICA_PORT_STEP * i
+        suffix = f" {i + 1}" if replicas > 1 else ""
+        if i < todoist_replicas:
+            children.append(Child(f"todoist_mq{suffix}", "todoist_mq.py", todoist_port + offset, {
+                **gateway_env,
+                "TODOIST_MQ_PORT": str(todoist_port + offset),
+                "TODOIST_METRICS_PORT": str(todoist_metrics + offset if todoist_metrics else 0)
+            }))
+        children.append(Child(f"google_sheet_mq{suffix}", "google_sheet_mq.py", google_sheet_port + offset, {
+            **gateway_env,
+            "GOOGLE_SHEET_MQ_PORT": str(google_sheet_port + offset),
+            "GOOGLE_SHEET_METRICS_PORT": str(google_sheet_metrics + offset if google_sheet_metrics else 0)
+        }))
+
+    if ingress:
+        # One ingress is enough, it reaches the replicas through the gateway
+        children.append(Child("ingress", "ingress.py", int(os.getenv("INGRESS_PORT", "8080")), ingress_env, http=True))
+    return children
+
+class SignalWaiter:
+    """
+    Sleeps until SIGCHLD, SIGINT or SIGTERM arrives or a timeout passes. The handlers only
+    note a stop request, the signal wakeup fd is what makes select() return, so a signal
+    that arrives just before the wait is not missed.
+    """
+    def __init__(self):
+        self.stop_requested = False
+        self.signals = [signal.SIGINT, signal.SIGTERM]
+        # Windows has no SIGCHLD, wait() polls for exited servers there
+        self.child_signal = getattr(signal, "SIGCHLD", None)
+        if self.child_signal is not None:
+            self.signals.append(self.child_signal)
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._previous_fd = signal.set_wakeup_fd(self._writer.fileno())
+        self._previous = {signum: signal.signal(signum, self._handle) for signum in self.signals}
+
+    def _handle(self, signum, frame):
+        if signum != self.child_signal:
+            self.stop_requested = True
+
+    def wait(self, timeout=None):
+        """Sleep for up to timeout seconds (None for ever), True once a stop was requested"""
+        if self.child_signal is None:
+            timeout = EXIT_POLL_INTERVAL if timeout is None else min(timeout, EXIT_POLL_INTERVAL)
+        if not self.stop_requested:
+            select.select([self._reader], [], [], timeout)
+        try:
+            while self._reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
             pass
-    except KeyboardInterrupt:
-        print("Stopping servers...")
+        return self.stop_requested
+
+    def close(self):
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+        signal.set_wakeup_fd(self._previous_fd)
+        self._reader.close()
+        self._writer.close()
+
+def supervise(children):
+    """Run the children until SIGINT or SIGTERM"""
+    waiter = SignalWaiter()
+    context = zmq.Context()
+    all_ready = False
+    try:
+        for child in children:
+            child.start()
+
+        while True:
+            now = time.monotonic()
+            for child in children:
+                if child.restart_at is not None:
+                    if now >= child.restart_at:
+                        child.start()
+                elif child.exited():
+                    if now - child.started_at >= STABLE_AFTER:
+                        child.crashes = 0
+                    delay = min(RESTART_BACKOFF * 2 ** child.crashes, RESTART_BACKOFF_MAX)
+                    child.crashes += 1
+                    child.restart_at = now + delay
+                    child.ready = all_ready = False
+                    print(f"{child.name} exited with code {child.process.returncode}, restarting in {delay:g}s...")
+                elif not child.ready:
+                    child.ready = probe_http(child.port) if child.http else probe(context, child.port)
+                    if child.ready:
+                        print(f"{child.name} is ready on port {child.port}")
+                    elif not child.warned and time.monotonic() - child.started_at > READY_WARNING:
+                        child.warned = True
+                        print(f"{child.name} is not ready after {READY_WARNING}s, still waiting...")
+
+            if not all_ready and all(child.ready for child in children):
+                all_ready = True
+                print("All servers are ready.")
+
+            # Sleep until a signal arrives or the next probe or restart is due
+            deadlines = [child.restart_at for child in children if child.restart_at is not None]
+            if not all(child.ready or child.restart_at is not None for child in children):
+                deadlines.append(time.monotonic() + PROBE_INTERVAL)
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            if waiter.wait(timeout):
+                print("Stopping servers...")
+                return
     finally:
-        for proc in running_processes:
-            stop_zeromq_server(proc)
\ No newline at end of file
+        stop(children)
+        context.term()
+        waiter.close()
+
+def stop(children):
+    running = [child.process for child in children if child.process and child.process.poll() is None]
+    for process in running:
+        process.terminate()
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for process in running:
+        try:
+            process.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        print(f"Stopped server with PID: {process.pid}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Start and supervise the ZeroMQ servers and the HTTP ingress.")
+    parser.add_argument("--replicas", type=int, default=int(os.getenv("SERVER_REPLICAS", "1")),
+                        help="instances of every server, more than 1 starts the gateway")
+    parser.add_argument("--no-ingress", dest="ingress", action="store_false",
+                        default=os.getenv("START_INGRESS", "1") == "1",
+                        help="do not start the HTTP ingress")
+    args = parser.parse_args()
+    supervise(build_children(max(1, args.replicas), args.ingress))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+'''
+Cold start benchmark for the ZeroMQ servers.
+
+Starts a server script in a new process several times and measures how long it takes
+until it answers status, and for google_sheet_mq until the Google Sheets client has
+finished loading (or failed, e.g. without credentials) as reported by status.
+
+Results go to startup_results.json.
+
+Usage:
+    python startup_benchmark.py --runs 5 --server google_sheet_mq
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import zmq
+
+import wire
+
+SERVERS = {
+    "google_sheet_mq": "GOOGLE_SHEET",
+    "todoist_mq": "TODOIST"
+}
+
+def status(context, port, timeout):
+    """The status result of the server on port, None if it did not answer within timeout"""
+    socket = context.socket(zmq.REQ)
+    socket.connect(f"tcp://localhost:{port}")
+    try:
+        socket.send_multipart(wire.encode_request({"method": "status", "params": {}}))
+        if not socket.poll(timeout * 1000):
+            return None
+        return wire.decode_reply(socket.recv_multipart()).get("result")
+    finally:
+        socket.close(linger=0)
+
+def measure(context, server, port, timeout):
+    """Start server once and return its timings in milliseconds"""
+    prefix = SERVERS[server]
+    env = {**os.environ, f"{prefix}_MQ_PORT": str(port), f"{prefix}_METRICS_PORT": "0", f"{prefix}_MQ_WORKERS": "1"}
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, f"{server}.py"], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    run = {"first_status_ms": None, "sheets_ms": None, "sheets": None}
+    try:
+        deadline = started + timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            result = status(context, port, 0.05)
+            if result is None:
+                continue
+            now_ms = (time.perf_counter() - started) * 1000
+            if run["first_status_ms"] is None:
+                run["first_status_ms"] = now_ms
+            # Only google_sheet_mq loads a client in the background
+            sheets = result.get("sheets") if isinstance(result, dict) else None
+            if sheets != "starting":
+                run["sheets"] = sheets
+                run["sheets_ms"] = now_ms if sheets else None
+                break
+    finally:
+        process.terminate()
+        process.wait()
+    return run
+
+def summarize(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return {"min_ms": min(values), "median_ms": statistics.median(values), "max_ms": max(values)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold start time of the ZeroMQ servers.")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="google_sheet_mq")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=7010, help="port the server is started on")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for one start")
+    parser.add_argument("-o", "--output", default="startup_results.json")
+    args = parser.parse_args()
+
+    context = zmq.Context()
+    runs = [measure(context, args.server, args.port, args.timeout) for _ in range(args.runs)]
+    context.term()
+
+    results = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "first_status": summarize(run["first_status_ms"] for run in runs),
+        "sheets_loaded": summarize(run["sheets_ms"] for run in runs),
+        "runs": runs
+    }
+    Path(args.output).write_text(json.dumps(results, indent=2))
+
+    for label in ("first_status", "sheets_loaded"):
+        stats = results[label]
+        if stats:
+            print(f"{label:<15} min {stats['min_ms']:>8.1f} ms  median {stats['median_ms']:>8.1f} ms  max {stats['max_ms']:>8.1f} ms")
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
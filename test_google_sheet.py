@@ -33,6 +33,19 @@ class TestGoogleSheetMQ(unittest.TestCase):
         print("Find person result:", response)
         self.assertTrue(response.get("success"))
 
+    def test_search_people(self):
+        """Test fuzzy search, a misspelled partial name still finds candidates ranked by score."""
+        request = {
+            "method": "search_people",
+            "params": {"query": "Jon Do"}
+        }
+        self.socket.send_string(json.dumps(request))
+        response = json.loads(self.socket.recv_string())
+        print("Search people result:", response)
+        self.assertTrue(response.get("success"))
+        scores = [r["score"] for r in response["result"]["results"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
     def test_insert_person_success(self):
         """Test successful insertion of a person."""
         request = {
@@ -50,6 +63,27 @@ class TestGoogleSheetMQ(unittest.TestCase):
         # For a robust test, you might add cleanup logic to delete the user.
         self.assertTrue(response.get("success"))
 
+    def test_insert_people(self):
+        """Test batched insertion, rows are checked one by one and written with one append."""
+        request = {
+            "method": "insert_people",
+            "params": {
+                "people": [
+                    {"name": "Batch User One", "age": 41, "occupation": "Tester"},
+                    {"name": "Batch User Two", "age": 42, "occupation": "Tester"},
+                    {"name": "Batch User Three"}
+                ]
+            }
+        }
+        self.socket.send_string(json.dumps(request))
+        response = json.loads(self.socket.recv_string())
+        print("Insert people result:", response)
+        self.assertTrue(response.get("success"))
+        results = response["result"]["results"]
+        self.assertEqual(len(results), 3)
+        # The incomplete row is rejected without failing the rest of the batch
+        self.assertFalse(results[2]["inserted"])
+
     def test_insert_person_incomplete_fails(self):
         """Test that inserting a person with incomplete data fails gracefully."""
         request = {"method": "insert_person", "params": {"name": "Bob Brown"}}
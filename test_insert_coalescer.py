@@ -0,0 +1,74 @@
+import threading
+import time
+import unittest
+
+from google_sheet_mq import InsertCoalescer
+
+class Sheet:
+    """insert_many that records its batches and answers every person with their name"""
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+
+    def insert_many(self, people):
+        self.batches.append(people)
+        if self.error:
+            raise self.error
+        return [{"inserted": True, "result": {"name": person["name"]}} for person in people]
+
+def insert_all(coalescer, names):
+    """Insert every name from its own thread, return {name: result or exception}"""
+    results = {}
+    def insert(name):
+        try:
+            results[name] = coalescer.insert({"name": name})
+        except Exception as e:
+            results[name] = e
+    threads = [threading.Thread(target=insert, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+class TestInsertCoalescer(unittest.TestCase):
+    def test_window_closes_early_at_max_batch(self):
+        """A full batch is written at once instead of waiting for the window."""
+        sheet = Sheet()
+        coalescer = InsertCoalescer(sheet.insert_many, window=10, max_batch=3)
+        start = time.monotonic()
+        results = insert_all(coalescer, ["Alice", "Bob", "Carol"])
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(len(sheet.batches), 1)
+        self.assertEqual(sorted(person["name"] for person in sheet.batches[0]), ["Alice", "Bob", "Carol"])
+        for name, result in results.items():
+            self.assertEqual(result["result"]["name"], name)
+
+    def test_single_insert_waits_for_the_window(self):
+        """An insert alone is written when the window closes."""
+        sheet = Sheet()
+        coalescer = InsertCoalescer(sheet.insert_many, window=0.1, max_batch=5)
+        start = time.monotonic()
+        self.assertEqual(coalescer.insert({"name": "Alice"})["result"], {"name": "Alice"})
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        self.assertEqual(len(sheet.batches), 1)
+
+    def test_next_insert_starts_a_new_batch(self):
+        """Inserts after a batch was written go into the next one."""
+        sheet = Sheet()
+        coalescer = InsertCoalescer(sheet.insert_many, window=0.01, max_batch=1)
+        coalescer.insert({"name": "Alice"})
+        coalescer.insert({"name": "Bob"})
+        self.assertEqual([[person["name"] for person in batch] for batch in sheet.batches], [["Alice"], ["Bob"]])
+
+    def test_errors_reach_every_caller(self):
+        """A failed append is raised to every insert of the batch."""
+        sheet = Sheet(RuntimeError("Failed to insert new person data."))
+        coalescer = InsertCoalescer(sheet.insert_many, window=10, max_batch=2)
+        results = insert_all(coalescer, ["Alice", "Bob"])
+        self.assertEqual(len(sheet.batches), 1)
+        for result in results.values():
+            self.assertIsInstance(result, RuntimeError)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from intent_parser import fast_parse, parse_intent
+
+class TestIntentParser(unittest.TestCase):
+    def test_sample_queries(self):
+        """The sample queries of app.py are parsed without the LLM where they are complete."""
+        cases = {
+            "Who is Alice Smith?": {"method": "find_person", "params": {"name": "Alice Smith"}},
+            "Find person named John Doe": {"method": "find_person", "params": {"name": "John Doe"}},
+            "What is status of my Todoist and Google Sheet servers?": {"method": "status", "params": {}},
+            "What is status of my Todoist": {"method": "status", "params": {}},
+            "Check my tasks in Todoist": {"method": "check_tasks", "params": {}},
+            "Add a new person named Alice Smith, age 30, occupation Engineer": {
+                "method": "insert_person",
+                "params": {"name": "Alice Smith", "age": 30, "occupation": "Engineer"}
+            },
+            "Add a new task to my Todoist with content 'Finish the report', "
+            "description 'Due by end of the week', due_string 'in 2 days'": {
+                "method": "add_task",
+                "params": {"content": "Finish the report", "description": "Due by end of the week",
+                           "due_string": "in 2 days"}
+            }
+        }
+        for query, expected in cases.items():
+            with self.subTest(query=query):
+                self.assertEqual(fast_parse(query), expected)
+
+    def test_left_to_the_llm(self):
+        """Chit-chat and incomplete writes go to the LLM."""
+        for query in ["Hello, who are you?", "Add a new person named Bob Brown without age and occupation"]:
+            with self.subTest(query=query):
+                self.assertIsNone(fast_parse(query))
+
+    def test_negated_writes(self):
+        """A negated write is never turned into a request."""
+        for query in ["Don't add a new person named Bob Brown age 30 occupation Engineer",
+                      "Do not add a new person named Bob Brown, age 30, occupation Engineer",
+                      "Never create a task with content 'a', description 'b', due 'today'"]:
+            with self.subTest(query=query):
+                self.assertEqual(parse_intent(query), (None, 0.0))
+
+    def test_hedged_queries(self):
+        """Hedged queries are left to the LLM."""
+        for query in ["Maybe add a new person named Bob Brown, age 30, occupation Engineer",
+                      "Should I check my tasks?",
+                      "Is the Todoist server not running?"]:
+            with self.subTest(query=query):
+                self.assertIsNone(fast_parse(query))
+
+    def test_write_must_be_a_command(self):
+        """A write verb that is only mentioned is not a request, a polite command is."""
+        self.assertIsNone(fast_parse("I told you to add a person named Bob Brown age 30 occupation Engineer"))
+        self.assertEqual(fast_parse("Please add a new person named Bob Brown, age 30, occupation Engineer")["method"],
+                         "insert_person")
+        self.assertEqual(fast_parse("Can you create a task with content 'a', description 'b', due 'today'")["method"],
+                         "add_task")
+
+    def test_status_needs_a_status_question(self):
+        """Status words about tasks or people, or outside a question about the servers, go to the LLM."""
+        for query in ["Check the status of my task list on Todoist",
+                      "Who is running the servers?",
+                      "The Todoist server keeps running out of memory"]:
+            with self.subTest(query=query):
+                self.assertIsNone(fast_parse(query))
+        for query in ["Is the Todoist server running?", "Check the health of the servers",
+                      "What's the status of Google Sheets?"]:
+            with self.subTest(query=query):
+                self.assertEqual(fast_parse(query), {"method": "status", "params": {}})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from json_stream import JSONObjectScanner, repair_json
+
+class TestJSONObjectScanner(unittest.TestCase):
+    def test_object_split_over_chunks(self):
+        """The object is returned as soon as its closing brace arrives."""
+        scanner = JSONObjectScanner()
+        self.assertIsNone(scanner.feed('Sure! {"method": "status", '))
+        self.assertEqual(scanner.feed('"params": {}} and more'), '{"method": "status", "params": {}}')
+
+    def test_braces_in_prose_are_skipped(self):
+        """Braces that are not JSON do not hide the object after them."""
+        scanner = JSONObjectScanner()
+        result = scanner.feed('Use {name} here: {"method": "status", "params": {}}')
+        self.assertEqual(json.loads(result), {"method": "status", "params": {}})
+
+class TestRepairJSON(unittest.TestCase):
+    def assertRepaired(self, text, expected):
+        repaired = repair_json(text)
+        self.assertIsNotNone(repaired, text)
+        self.assertEqual(json.loads(repaired), expected)
+
+    def test_fenced_object_with_trailing_comma_and_prose(self):
+        """A fenced object with a trailing comma is repaired, prose after the fence is dropped."""
+        self.assertRepaired('Sure ```json {"method": "find_person", "params": {"name": "X"},} ``` hope it helps',
+                            {"method": "find_person", "params": {"name": "X"}})
+
+    def test_unquoted_keys_followed_by_prose(self):
+        """Unquoted keys are quoted, text after the object is dropped."""
+        self.assertRepaired('Here: {method: "status", params: {}} -- done', {"method": "status", "params": {}})
+
+    def test_single_quotes_followed_by_prose(self):
+        """Single quoted strings become double quoted, text after the object is dropped."""
+        self.assertRepaired("Answer: {'method': 'status', 'params': {}}. Thanks", {"method": "status", "params": {}})
+
+    def test_apostrophe_in_single_quoted_python_dict(self):
+        """A Python dictionary with an escaped apostrophe is read as such."""
+        self.assertRepaired("{'method': 'find_person', 'params': {'name': 'O\\'Brien'}} ok",
+                            {"method": "find_person", "params": {"name": "O'Brien"}})
+
+    def test_python_literals_and_typographic_quotes(self):
+        """Python literals and typographic quotes are turned into JSON."""
+        self.assertRepaired("{“method”: “status”, “params”: {“verbose”: True}}",
+                            {"method": "status", "params": {"verbose": True}})
+
+    def test_truncated_object(self):
+        """The missing closing brackets of a truncated object are added."""
+        self.assertRepaired('{"method": "find_person", "params": {"name": "X"',
+                            {"method": "find_person", "params": {"name": "X"}})
+
+    def test_no_object(self):
+        """Text without an object cannot be repaired."""
+        self.assertIsNone(repair_json("I cannot help with that."))
+        self.assertIsNone(repair_json(None))
+
+if __name__ == "__main__":
+    unittest.main()
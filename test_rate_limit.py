@@ -0,0 +1,99 @@
+import threading
+import time
+import unittest
+
+from rate_limit import READ, WRITE, QuotaExceededError, RateLimiter, retry_after
+
+class Response(dict):
+    """An httplib2 response: a dictionary of lowercase headers with a status"""
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+
+class HttpError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.resp = Response(status, headers)
+
+class Flaky:
+    """Answers 429 the first failures times, then returns "ok\""""
+    def __init__(self, failures, headers=None):
+        self.failures = failures
+        self.headers = headers
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise HttpError(429, self.headers)
+        return "ok"
+
+class TestRetryAfter(unittest.TestCase):
+    def test_retry_after_header(self):
+        """The seconds of a 429's Retry-After header are returned."""
+        self.assertEqual(retry_after(HttpError(429, {"retry-after": "3"})), 3.0)
+
+    def test_429_without_header(self):
+        """A 429 without Retry-After waits 0 seconds, the limiter's backoff applies."""
+        self.assertEqual(retry_after(HttpError(429)), 0.0)
+
+    def test_other_errors(self):
+        """Errors that are not a 429 are not retried."""
+        self.assertIsNone(retry_after(HttpError(500)))
+        self.assertIsNone(retry_after(ValueError("bad value")))
+
+class TestRateLimiter(unittest.TestCase):
+    def test_reads_go_before_writes(self):
+        """A read that queues after a write still gets the next token first."""
+        limiter = RateLimiter("test", rate_per_minute=600, burst=1)
+        limiter.pause(0.3)
+        order = []
+        writer = threading.Thread(target=lambda: (limiter.acquire(WRITE), order.append("write")))
+        reader = threading.Thread(target=lambda: (limiter.acquire(READ), order.append("read")))
+        writer.start()
+        time.sleep(0.05)
+        reader.start()
+        writer.join(5)
+        reader.join(5)
+        self.assertEqual(order, ["read", "write"])
+
+    def test_burst_then_rate(self):
+        """A burst goes out at once, the next call waits for a token."""
+        limiter = RateLimiter("test", rate_per_minute=600, burst=3)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_429_pauses_and_retries(self):
+        """A 429 pauses the limiter for its Retry-After, then the call is retried."""
+        limiter = RateLimiter("test", rate_per_minute=0, burst=1, backoff=0.01)
+        fn = Flaky(1, {"retry-after": "0.2"})
+        start = time.monotonic()
+        self.assertEqual(limiter.call(fn), "ok")
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(fn.calls, 2)
+
+    def test_quota_exceeded_after_the_retries(self):
+        """A call that keeps getting 429 gives up with QuotaExceededError."""
+        limiter = RateLimiter("test", rate_per_minute=0, burst=1, max_retries=2, backoff=0.01)
+        fn = Flaky(10)
+        with self.assertRaises(QuotaExceededError):
+            limiter.call(fn)
+        self.assertEqual(fn.calls, 3)
+
+    def test_other_errors_are_not_retried(self):
+        """Errors other than 429 are raised at once."""
+        limiter = RateLimiter("test", rate_per_minute=0, burst=1)
+        calls = []
+        def fail():
+            calls.append(1)
+            raise HttpError(500)
+        with self.assertRaises(HttpError):
+            limiter.call(fail)
+        self.assertEqual(len(calls), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import threading
+import time
+import unittest
+
+from mq_server import single_flight
+from singleflight import SingleFlight
+
+class CountingCall:
+    """A call that counts how often it ran and can be held until released"""
+    def __init__(self, result="result", hold=False):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not hold:
+            self.release.set()
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return self.result
+
+def in_thread(fn):
+    """Run fn in a thread, return the thread and the list its result is put in"""
+    results = []
+    thread = threading.Thread(target=lambda: results.append(fn()))
+    thread.start()
+    return thread, results
+
+class TestSingleFlight(unittest.TestCase):
+    def test_calls_in_flight_are_shared(self):
+        """A call with the key of one in flight waits for it instead of running again."""
+        flight = SingleFlight()
+        fn = CountingCall(hold=True)
+        leader, leader_results = in_thread(lambda: flight.do("key", fn))
+        fn.started.wait(5)
+        follower, follower_results = in_thread(lambda: flight.do("key", fn))
+        time.sleep(0.1)
+        fn.release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(fn.calls, 1)
+        self.assertEqual(leader_results, [("result", False)])
+        self.assertEqual(follower_results, [("result", True)])
+
+    def test_other_keys_are_not_shared(self):
+        """Calls with different keys both run."""
+        flight = SingleFlight(ttl=60)
+        fn = CountingCall()
+        flight.do("a", fn)
+        flight.do("b", fn)
+        self.assertEqual(fn.calls, 2)
+
+    def test_result_is_kept_for_the_ttl(self):
+        """With a ttl a finished result is handed to the next identical call."""
+        flight = SingleFlight(ttl=60)
+        fn = CountingCall()
+        self.assertEqual(flight.do("key", fn), ("result", False))
+        self.assertEqual(flight.do("key", fn), ("result", True))
+        self.assertEqual(fn.calls, 1)
+
+    def test_without_ttl_nothing_is_kept(self):
+        """Without a ttl every call after the last one finished runs again."""
+        flight = SingleFlight()
+        fn = CountingCall()
+        flight.do("key", fn)
+        flight.do("key", fn)
+        self.assertEqual(fn.calls, 2)
+
+    def test_forget_drops_kept_results(self):
+        """After forget the next call runs again."""
+        flight = SingleFlight(ttl=60)
+        fn = CountingCall()
+        flight.do("key", fn)
+        flight.forget()
+        self.assertEqual(flight.do("key", fn), ("result", False))
+        self.assertEqual(fn.calls, 2)
+
+    def test_forget_during_a_call(self):
+        """A call in flight during forget is neither joined nor kept."""
+        flight = SingleFlight(ttl=60)
+        stale = CountingCall("stale", hold=True)
+        leader, leader_results = in_thread(lambda: flight.do("key", stale))
+        stale.started.wait(5)
+        flight.forget()
+        fresh = CountingCall("fresh")
+        self.assertEqual(flight.do("key", fresh), ("fresh", False))
+        stale.release.set()
+        leader.join(5)
+        self.assertEqual(leader_results, [("stale", False)])
+        # The stale result did not replace the fresh one
+        self.assertEqual(flight.do("key", CountingCall("other")), ("fresh", True))
+
+    def test_exceptions_are_raised(self):
+        """An exception of the call reaches its caller and nothing is kept."""
+        flight = SingleFlight(ttl=60)
+        def fail():
+            raise RuntimeError("upstream down")
+        with self.assertRaises(RuntimeError):
+            flight.do("key", fail)
+        self.assertEqual(flight.do("key", CountingCall()), ("result", False))
+
+class TestSingleFlightMethods(unittest.TestCase):
+    def setUp(self):
+        self.find = CountingCall({"name": "Alice"})
+        self.insert = CountingCall({"inserted": True})
+        self.status = CountingCall({"status": "ok"})
+        self.api = single_flight({"find_person": self.find, "insert_person": self.insert, "status": self.status},
+                                 ["find_person"], "test", ttl=60, write_methods=["insert_person"])
+
+    def test_reads_are_coalesced_by_params(self):
+        """Reads with the same params share a result, other params do not."""
+        self.api["find_person"](name="Alice")
+        self.api["find_person"](name="Alice")
+        self.api["find_person"](name="Bob")
+        self.assertEqual(self.find.calls, 2)
+
+    def test_writes_drop_kept_reads(self):
+        """A write makes the next read run again."""
+        self.api["find_person"](name="Alice")
+        self.api["insert_person"](name="Alice", age=30, occupation="Engineer")
+        self.api["find_person"](name="Alice")
+        self.assertEqual(self.find.calls, 2)
+        self.assertEqual(self.insert.calls, 1)
+
+    def test_other_methods_are_left_alone(self):
+        """Methods that are neither reads nor writes are not wrapped."""
+        self.assertIs(self.api["status"], self.status)
+
+if __name__ == "__main__":
+    unittest.main()
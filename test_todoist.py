@@ -48,5 +48,13 @@ class TestTodoistMQ(unittest.TestCase):
         print("Check tasks result:", response)
         self.assertTrue(response.get("success"))
 
+    def test_task_status_unknown_fails(self):
+        """Test that looking up an unknown queued task fails gracefully."""
+        request = {"method": "task_status", "params": {"local_id": "does-not-exist"}}
+        self.socket.send_string(json.dumps(request))
+        response = json.loads(self.socket.recv_string())
+        print("Task status result:", response)
+        self.assertFalse(response.get("success"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
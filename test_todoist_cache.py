@@ -0,0 +1,68 @@
+import unittest
+
+from todoist_cache import TaskCache
+
+def item(task_id, content="Task", project_id="p1", **flags):
+    return {"id": task_id, "content": content, "description": "", "project_id": project_id, **flags}
+
+class Todoist:
+    """sync_fn that answers every call with the next of the given responses and records the tokens"""
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.tokens = []
+
+    def sync(self, sync_token):
+        self.tokens.append(sync_token)
+        return self.responses.pop(0)
+
+class TestTaskCache(unittest.TestCase):
+    def test_full_then_incremental_sync(self):
+        """Changes are applied on top of the first full download."""
+        todoist = Todoist(
+            ([item("1", "Report"), item("2", "Email"), item("3", "Other", project_id="p2")], "token1", True),
+            ([item("1", "Final report"), item("2", checked=True), item("4", "Call")], "token2", False)
+        )
+        cache = TaskCache(todoist.sync, "p1")
+        cache.sync()
+        self.assertEqual([task["content"] for task in cache.tasks()], ["Report", "Email"])
+        cache.sync()
+        self.assertEqual({task["id"]: task["content"] for task in cache.tasks()}, {"1": "Final report", "4": "Call"})
+        self.assertEqual(todoist.tokens, ["*", "token1"])
+
+    def test_deleted_tasks_are_dropped(self):
+        """Deleted tasks leave the cache."""
+        todoist = Todoist(([item("1"), item("2")], "token1", True), ([item("1", is_deleted=True)], "token2", False))
+        cache = TaskCache(todoist.sync, "p1")
+        cache.sync()
+        cache.sync()
+        self.assertEqual([task["id"] for task in cache.tasks()], ["2"])
+
+    def test_reads_sync_only_when_stale(self):
+        """A read syncs first when the cache is empty or older than max_age, not otherwise."""
+        todoist = Todoist(([item("1")], "token1", True), ([item("2")], "token2", False))
+        cache = TaskCache(todoist.sync, "p1", max_age=60)
+        cache.tasks()
+        cache.tasks()
+        self.assertEqual(len(todoist.tokens), 1)
+        cache.max_age = 0
+        self.assertEqual(len(cache.tasks()), 2)
+        self.assertEqual(len(todoist.tokens), 2)
+
+    def test_invalidate_downloads_everything_again(self):
+        """After invalidate the next read does a full sync."""
+        todoist = Todoist(([item("1")], "token1", True), ([item("2")], "token2", True))
+        cache = TaskCache(todoist.sync, "p1")
+        cache.tasks()
+        cache.invalidate()
+        self.assertEqual([task["id"] for task in cache.tasks()], ["2"])
+        self.assertEqual(todoist.tokens, ["*", "*"])
+
+    def test_put_adds_a_created_task(self):
+        """A task created through the server is readable before the next sync."""
+        cache = TaskCache(Todoist(([], "token1", True)).sync, "p1", max_age=60)
+        cache.sync()
+        cache.put(42, "Report", "By Friday")
+        self.assertEqual(cache.tasks(), [{"id": "42", "content": "Report", "description": "By Friday"}])
+
+if __name__ == "__main__":
+    unittest.main()
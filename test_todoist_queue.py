@@ -0,0 +1,87 @@
+import os
+import tempfile
+import time
+import unittest
+
+from todoist_queue import TaskQueue
+
+class Todoist:
+    """push_fn that fails the first failures times, then returns a new task ID"""
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.pushed = []
+
+    def push(self, content, description, due_string):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Todoist is down")
+        self.pushed.append((content, description, due_string))
+        return 1000 + len(self.pushed)
+
+class TestTaskQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "queue.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def wait_for(self, queue, local_id, status):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            state = queue.status(local_id)
+            if state["status"] == status:
+                return state
+            time.sleep(0.01)
+        self.fail(f"Task {local_id} is still {queue.status(local_id)['status']}, expected {status}")
+
+    def test_enqueue_answers_before_delivery(self):
+        """A queued task is pending until the flush thread runs."""
+        queue = TaskQueue(self.path, Todoist().push)
+        local_id = queue.enqueue("Report", "By Friday", "tomorrow")
+        self.assertEqual(queue.status(local_id)["status"], "pending")
+        self.assertIsNone(queue.status(local_id)["task_id"])
+
+    def test_delivery(self):
+        """The flush thread pushes the task and records its Todoist ID."""
+        todoist = Todoist()
+        queue = TaskQueue(self.path, todoist.push)
+        queue.start()
+        local_id = queue.enqueue("Report", "By Friday", "tomorrow")
+        state = self.wait_for(queue, local_id, "done")
+        self.assertEqual(state["task_id"], "1001")
+        self.assertEqual(todoist.pushed, [("Report", "By Friday", "tomorrow")])
+
+    def test_failures_are_retried(self):
+        """A failed push is retried after a backoff."""
+        queue = TaskQueue(self.path, Todoist(failures=2).push, retry_delay=0.01)
+        queue.start()
+        local_id = queue.enqueue("Report", "", "today")
+        state = self.wait_for(queue, local_id, "done")
+        self.assertEqual(state["attempts"], 3)
+        self.assertIsNone(state["error"])
+
+    def test_gives_up_after_max_attempts(self):
+        """A task that keeps failing is marked failed with the last error."""
+        queue = TaskQueue(self.path, Todoist(failures=10).push, max_attempts=2, retry_delay=0.01)
+        queue.start()
+        local_id = queue.enqueue("Report", "", "today")
+        state = self.wait_for(queue, local_id, "failed")
+        self.assertEqual(state["attempts"], 2)
+        self.assertEqual(state["error"], "Todoist is down")
+
+    def test_tasks_survive_a_restart(self):
+        """Tasks left in the file by a previous run are delivered when the queue starts."""
+        local_id = TaskQueue(self.path, Todoist().push).enqueue("Report", "", "today")
+        todoist = Todoist()
+        queue = TaskQueue(self.path, todoist.push)
+        queue.start()
+        self.wait_for(queue, local_id, "done")
+        self.assertEqual(len(todoist.pushed), 1)
+
+    def test_unknown_id(self):
+        """An unknown local ID has no status."""
+        self.assertIsNone(TaskQueue(self.path, Todoist().push).status("does-not-exist"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,13 +12,19 @@ Install the library using pip:
 
 from todoist_api_python.api import TodoistAPI
 import os
+import requests
 from dotenv import load_dotenv
+from metrics import upstream
+from rate_limit import get_limiter
 
 load_dotenv()
 
 # Initialize the API
 api = TodoistAPI(os.getenv("TODOIST_API_TOKEN"))
 
+# The Sync API is not wrapped by todoist-api-python
+SYNC_URL = "https://api.todoist.com/api/v1/sync"
+
 def show_all_projects():
     try:
         projects_iterator = api.get_projects()
@@ -64,6 +70,25 @@ def add_task(content, description, project_id, due_string):
     except Exception as error:
         print(error)
 
+def sync_items(sync_token="*"):
+    """
+    Incremental sync of tasks, called items by the Sync API.
+    Pass "*" for a full sync, or the token of the previous call to only get what changed since.
+    Returns (items, new_sync_token, full_sync).
+    """
+    def post():
+        with upstream("todoist"):
+            response = requests.post(
+                SYNC_URL,
+                headers={"Authorization": f"Bearer {os.getenv('TODOIST_API_TOKEN')}"},
+                data={"sync_token": sync_token, "resource_types": '["items"]'},
+                timeout=60
+            )
+            response.raise_for_status()
+        return response
+    data = get_limiter("todoist").call(post).json()
+    return data.get("items", []), data["sync_token"], data.get("full_sync", False)
+
 if __name__ == "__main__":
     PROJECT_ID = os.getenv("PROJECT_ID")
     show_all_projects()
@@ -0,0 +1,84 @@
+import threading
+import time
+
+class TaskCache:
+    """
+    In-memory copy of the active tasks of one project, kept current with incremental syncs.
+    sync_fn(sync_token) returns (items, new_sync_token, full_sync) like todoist_api.sync_items:
+    the first call uses "*" to download everything, later calls only receive the changes.
+    A background thread syncs every sync_interval seconds so reads are answered from memory;
+    a read never returns data older than max_age seconds, it syncs first instead.
+    """
+    def __init__(self, sync_fn, project_id=None, max_age=300.0, sync_interval=10.0):
+        self.sync_fn = sync_fn
+        self.project_id = project_id
+        self.max_age = max_age
+        self.sync_interval = sync_interval
+        self._tasks = {}
+        self._sync_token = "*"
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """Start the background sync thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sync_loop, name="Todoist task cache", daemon=True)
+            self._thread.start()
+
+    def tasks(self):
+        """Return the cached tasks, syncing first if the cache is empty or older than max_age"""
+        synced_at = self._synced_at
+        if synced_at is None or time.monotonic() - synced_at >= self.max_age:
+            self.sync()
+        with self._lock:
+            return list(self._tasks.values())
+
+    def sync(self):
+        """Apply the changes since the last sync, or load everything after an invalidation"""
+        # Only one sync at a time, the sync token must be used in order
+        with self._sync_lock:
+            with self._lock:
+                sync_token = self._sync_token
+            items, new_token, full_sync = self.sync_fn(sync_token)
+            with self._lock:
+                if full_sync:
+                    self._tasks = {}
+                for item in items:
+                    self._apply(item)
+                self._sync_token = new_token
+                self._synced_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the cached tasks, the next read does a full sync"""
+        with self._sync_lock, self._lock:
+            self._tasks = {}
+            self._sync_token = "*"
+            self._synced_at = None
+
+    def put(self, task_id, content, description):
+        """Write-through for a task that was just created"""
+        with self._lock:
+            self._tasks[str(task_id)] = {"id": str(task_id), "content": content, "description": description}
+
+    def _apply(self, item):
+        task_id = str(item["id"])
+        removed = item.get("is_deleted") or item.get("checked")
+        other_project = self.project_id and str(item.get("project_id")) != str(self.project_id)
+        if removed or other_project:
+            self._tasks.pop(task_id, None)
+        else:
+            self._tasks[task_id] = {
+                "id": task_id,
+                "content": item.get("content"),
+                "description": item.get("description")
+            }
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Todoist task cache sync failed: {e}")
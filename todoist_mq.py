@@ -1,102 +1,136 @@
 import todoist_api as todoist
-import zmq
-import json
 import os
 from dotenv import load_dotenv
+from mq_server import serve
+from metrics import upstream
+from rate_limit import get_limiter
+from todoist_queue import TaskQueue
+from todoist_cache import TaskCache
 
 load_dotenv()
 PROJECT_ID = os.getenv("PROJECT_ID")
 
+# Write-behind mode: add_task only queues the task locally and a background thread sends it
+WRITE_BEHIND = os.getenv("TODOIST_WRITE_BEHIND", "0") == "1"
+QUEUE_PATH = os.getenv("TODOIST_QUEUE_PATH", "todoist_queue.db")
+
+# Task cache for check_tasks: seconds between background syncs and the oldest data it may return, 0 disables it
+CACHE_SYNC_INTERVAL = float(os.getenv("TODOIST_CACHE_SYNC_INTERVAL", "10"))
+CACHE_MAX_AGE = float(os.getenv("TODOIST_CACHE_MAX_AGE", "300"))
+task_cache = TaskCache(todoist.sync_items, PROJECT_ID, CACHE_MAX_AGE, CACHE_SYNC_INTERVAL) if CACHE_MAX_AGE > 0 else None
+
 def get_status():
     """Get server status"""
     return {"status": "ok", "message": "Server is running"}
 
+def create_task(content, description, due_string):
+    """Create the task in Todoist and return it"""
+    def add():
+        with upstream("todoist"):
+            return todoist.api.add_task(
+                content=content,
+                description=description,
+                project_id=PROJECT_ID,
+                due_string=due_string
+            )
+    task = get_limiter("todoist").call(add, write=True)
+    if task_cache:
+        task_cache.put(task.id, task.content, task.description)
+    return task
+
+def push_queued_task(content, description, due_string):
+    """Deliver a task from the write-behind queue, returns the Todoist task ID"""
+    return create_task(content, description, due_string).id
+
+task_queue = TaskQueue(QUEUE_PATH, push_queued_task) if WRITE_BEHIND else None
+
 def add_task(content, description, due_string):
     """Add a new task to Todoist"""
     try:
-        task = todoist.api.add_task(
-            content=content,
-            description=description,
-            project_id=PROJECT_ID,
-            due_string=due_string
-        )
+        if task_queue:
+            local_id = task_queue.enqueue(content, description, due_string)
+            return {"local_id": local_id, "queued": True, "content": content}
+        task = create_task(content, description, due_string)
         return {"task_id": task.id, "content": task.content}
     except Exception as e:
         raise RuntimeError(f"Failed to add task: {str(e)}")
+
+def task_status(local_id):
+    """Look up a task queued in write-behind mode, including its Todoist ID once delivered"""
+    if not task_queue:
+        raise RuntimeError("Write-behind mode is disabled, add_task returns the Todoist ID directly.")
+    status = task_queue.status(local_id)
+    if status is None:
+        raise RuntimeError(f"Queued task '{local_id}' not found.")
+    return status
     
-def check_tasks():
-    """Check and return all tasks in the project"""
+def check_tasks(offset=None, limit=None):
+    """
+    Check and return all tasks in the project. With offset or limit only that page is
+    returned, as {"tasks": [...], "total": ..., "next_offset": ...}, next_offset is None
+    on the last page. Pages keep the replies of a large project small.
+    """
     try:
-        tasks_iter = todoist.api.get_tasks(project_id=PROJECT_ID)
-        tasks = []
-        for task_list in tasks_iter:
-            tasks.extend(task_list)
-        return [{"id": task.id, "content": task.content, "description": task.description} for task in tasks]
+        if task_cache:
+            tasks = task_cache.tasks()
+        else:
+            def fetch():
+                # Every page is a request to Todoist, a project rarely has more than one page
+                with upstream("todoist"):
+                    return [task for task_list in todoist.api.get_tasks(project_id=PROJECT_ID) for task in task_list]
+            tasks = get_limiter("todoist").call(fetch)
+            tasks = [{"id": task.id, "content": task.content, "description": task.description} for task in tasks]
     except Exception as e:
         raise RuntimeError(f"Failed to fetch tasks: {str(e)}")
+    if offset is None and limit is None:
+        return tasks
+    return page(tasks, offset, limit)
 
-def main():
-    # Setup ZeroMQ context and socket
-    context = zmq.Context()
-    socket = context.socket(zmq.REP)
-    socket.bind("tcp://*:6001")
-    
-    print("Todoist Server started. Listening on port 6001...")
-    
+def page(tasks, offset, limit):
+    """One page of tasks, without a limit it runs to the last task"""
+    offset = 0 if offset is None else offset
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("offset must be a non-negative integer.")
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        raise ValueError("limit must be a positive integer.")
+    end = len(tasks) if limit is None else min(offset + limit, len(tasks))
+    return {
+        "tasks": tasks[offset:end],
+        "total": len(tasks),
+        "next_offset": end if end < len(tasks) else None
+    }
+
+def invalidate_tasks():
+    """Drop the cached tasks so the next check_tasks reloads them from Todoist"""
+    if task_cache:
+        task_cache.invalidate()
+    return {"invalidated": task_cache is not None}
+
+def main(port=None):
     # Function mapping
-    try:
-        api_functions = {
-            "status": get_status,
-            "add_task": add_task,
-            "check_tasks": check_tasks
-        }
-        
-        while True:
-            try:
-                # Receive request
-                message = socket.recv_string()
-                print(f"Received request: {message}")
-                
-                # Parse JSON request
-                request = json.loads(message)
-                method = request.get("method")
-                params = request.get("params", {})
-                
-                # Process request
-                if method in api_functions:
-                    try:
-                        result = api_functions[method](**params)
-                        response = {
-                            "success": True,
-                            "result": result
-                        }
-                    except Exception as e:
-                        response = {
-                            "success": False,
-                            "error": str(e)
-                        }
-                else:
-                    response = {
-                        "success": False,
-                        "error": f"Method '{method}' not found"
-                    }
-                
-                # Send response
-                socket.send_string(json.dumps(response))
-                
-            except Exception as e:
-                # Handle unexpected errors during request processing
-                error_response = {
-                    "success": False,
-                    "error": f"Server error: {str(e)}"
-                }
-                socket.send_string(json.dumps(error_response))
-    except KeyboardInterrupt:
-        print("\nShutting down Todoist server...")
-    finally:
-        # Ensure the socket and context are closed on exit
-        socket.close()
-        context.term()
+    api_functions = {
+        "status": get_status,
+        "add_task": add_task,
+        "check_tasks": check_tasks,
+        "task_status": task_status,
+        "invalidate_tasks": invalidate_tasks
+    }
+
+    # Keep the task cache current in the background
+    if task_cache:
+        task_cache.start()
+
+    # Deliver tasks queued by this and by previous runs
+    if task_queue:
+        task_queue.start()
+
+    # Number of worker threads, each one can hold an upstream API call in flight
+    workers = int(os.getenv("TODOIST_MQ_WORKERS", "4"))
+    port = port or int(os.getenv("TODOIST_MQ_PORT", "6001"))
+    metrics_port = int(os.getenv("TODOIST_METRICS_PORT", "8081"))
+    serve(api_functions, port, "Todoist", workers, metrics_port,
+          service="todoist", read_methods=["check_tasks", "task_status"],
+          write_methods=["add_task", "invalidate_tasks"])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
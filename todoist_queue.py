@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+import uuid
+
+class TaskQueue:
+    """
+    Durable SQLite queue of tasks waiting to be written to Todoist.
+    enqueue() stores the task and returns a local ID straight away, a background thread
+    pushes pending tasks with push_fn and retries failures with exponential backoff.
+    Tasks left in the file by a previous run are flushed when the queue starts.
+    """
+    def __init__(self, path, push_fn, max_attempts=5, retry_delay=2.0):
+        self.push_fn = push_fn
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                local_id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                description TEXT,
+                due_string TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                task_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="Todoist write-behind", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, content, description, due_string):
+        """Store a task for later delivery and return its local ID"""
+        local_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO tasks (local_id, content, description, due_string, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (local_id, content, description, due_string, now, now)
+            )
+        self._wakeup.set()
+        return local_id
+
+    def status(self, local_id):
+        """Return the delivery state of a queued task, or None if the ID is unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT local_id, status, task_id, attempts, error FROM tasks WHERE local_id = ?",
+                (local_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("local_id", "status", "task_id", "attempts", "error"), row))
+
+    def _next_pending(self):
+        """Return the oldest task that is due for an attempt and the seconds until the next one"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT local_id, content, description, due_string, attempts, next_attempt_at FROM tasks "
+                "WHERE status = 'pending' ORDER BY next_attempt_at, created_at LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None, None
+        wait = row[5] - time.time()
+        if wait > 0:
+            return None, wait
+        return row, 0
+
+    def _flush_loop(self):
+        while True:
+            task, wait = self._next_pending()
+            if task is None:
+                # Sleep until the next retry is due or a new task is enqueued
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+
+            local_id, content, description, due_string, attempts, _ = task
+            try:
+                task_id = self.push_fn(content, description, due_string)
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = 'done', task_id = ?, attempts = ?, error = NULL WHERE local_id = ?",
+                        (str(task_id), attempts + 1, local_id)
+                    )
+            except Exception as e:
+                attempts += 1
+                status = "failed" if attempts >= self.max_attempts else "pending"
+                next_attempt_at = time.time() + self.retry_delay * 2 ** (attempts - 1)
+                print(f"Failed to push queued task {local_id} (attempt {attempts}): {e}")
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE tasks SET status = ?, attempts = ?, error = ?, next_attempt_at = ? WHERE local_id = ?",
+                        (status, attempts, str(e), next_attempt_at, local_id)
+                    )
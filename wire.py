@@ -0,0 +1,67 @@
+'''
+Wire format of the ZeroMQ messages.
+
+Legacy clients send one frame holding a JSON string and get one JSON frame back.
+Newer clients send multipart messages [codec, payload] where codec names the
+serialization (b"msgpack" or b"json"); the server answers in the same codec with
+[codec, response].
+
+A ZeroMQ message is delivered whole, so a reply is always encoded, sent and received as
+one piece: a large result is held in memory on both sides, which is why check_tasks
+takes offset and limit to return one page of a long task list.
+'''
+
+import json
+import os
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = b"json"
+MSGPACK = b"msgpack"
+CODECS = (MSGPACK, JSON) if msgpack else (JSON,)
+
+def default_codec():
+    """Codec for new requests: WIRE_CODEC if set, otherwise msgpack when installed"""
+    codec = os.getenv("WIRE_CODEC", "").encode()
+    if codec in CODECS:
+        return codec
+    return MSGPACK if msgpack else JSON
+
+def encode(codec, obj):
+    if codec == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj).encode()
+
+def decode(codec, data):
+    if codec == MSGPACK:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+def encode_request(request, codec=None):
+    """Frames of a request dictionary"""
+    codec = codec or default_codec()
+    return [codec, encode(codec, request)]
+
+def decode_request(frames):
+    """Return (codec, request dictionary), codec is None for a legacy single frame JSON request"""
+    if len(frames) == 1:
+        return None, json.loads(frames[0].decode())
+    codec = frames[0]
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported codec '{codec.decode(errors='replace')}'")
+    return codec, decode(codec, frames[1])
+
+def encode_reply(codec, response):
+    """Frames of a response in the codec of its request"""
+    if codec is None:
+        return [json.dumps(response).encode()]
+    return [codec, encode(codec, response)]
+
+def decode_reply(frames):
+    """The response dictionary of a reply"""
+    if len(frames) == 1:
+        return json.loads(frames[0].decode())
+    return decode(frames[0], frames[1])